@@ -3,24 +3,137 @@ import logging
 import argparse
 import sys
 import os
-import re
 import inspect
 import getpass
-import pandas as pd
-from app.logger import logger
-from app.xiq_api import XIQ
+import time
+import threading
+import atexit
+import random
+import signal
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.logger import logger, setupLogging
+from app.location_cache import LocationCache
+from app.token_cache import TokenCache
+from app.device_state import DeviceStateStore
+from app.history import PoEHistory
+from app.alerts import StatusWatcher, parseSink
+from app.writers import ResultReport, WRITERS
+from app.profiler import RunProfiler
+from app.capability import CAPABILITY_FIELDS, filterSupported
+from app.inventory import DeviceInventory
+from app.cli_parser import parseOutputs, DETAIL_FIELDS
+from app.results import resultRow, assembleBatch, failedRows, UNSUPPORTED_STATUS, UNKNOWN_STATUS, FAILED_STATUS
 current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 logger = logging.getLogger('PoE_Check.Main')
 
 XIQ_API_token = ''
 
 pageSize = 100
+# only the device fields used by the check are requested instead of the FULL view,
+# the device function is used to skip platforms that can't run the CLI command
+deviceFields = ['ID', 'HOSTNAME'] + CAPABILITY_FIELDS
+# extra fields collected with --incremental to tell if a device has changed since its last check
+fingerprintFields = ['LAST_CONNECT_TIME', 'SOFTWARE_VERSION', 'PRODUCT_TYPE']
+# with --incremental a stored result is reused for up to incrementalMaxAge secs
+incrementalMaxAge = 6*60*60
+
+# HTTP session settings - connections are pooled and kept alive for every XIQ call
+poolSize = 10
+connectTimeout = 10
+readTimeout = 60
+# all requests are paced to rateLimit per second with bursts of up to rateBurst, 429s and 5xx errors are retried with backoff
+rateLimit = 10
+rateBurst = 20
+# number of device pages fetched concurrently once the page count is known
+pageWorkers = 5
+# number of floors collected at the same time
+floorConcurrency = 4
+# CLI long-running operation polling - first check after lroFirstPoll secs, backing off up to
+# lroMaxInterval secs between checks, giving up after lroTimeout secs
+lroFirstPoll = 2
+lroMaxInterval = 60
+lroTimeout = 1800
+# devices are sent the CLI command in batches of cliBatchSize, with up to cliMaxInFlight batches running at once
+cliBatchSize = 500
+cliMaxInFlight = 3
+# number of accounts checked at the same time with --sweep_accounts
+accountConcurrency = 4
+# building and floor lookups are cached on disk for locationCacheTTL secs
+locationCacheTTL = 24*60*60
+# with --watch the buildings are re-checked every watchInterval secs, give or take watchJitter of it,
+# and the floors and devices are collected again every inventoryInterval secs
+watchInterval = 15*60
+watchJitter = 0.1
+inventoryInterval = 6*60*60
+# access tokens from logins are saved and reused until tokenRefreshMargin secs before they expire
+tokenRefreshMargin = 5*60
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--external',action="store_true", help="Optional - adds External Account selection, to use an external VIQ")
+parser.add_argument('--refresh_locations',action="store_true", help="Optional - ignores the cached floor list for the building and collects it from XIQ again")
+parser.add_argument('--no_location_cache',action="store_true", help="Optional - does not read or write the local location cache")
+parser.add_argument('--no_token_cache',action="store_true", help="Optional - does not save or reuse XIQ access tokens between runs")
+parser.add_argument('--incremental',action="store_true", help="Optional - only sends the CLI command to devices that are new, have changed or whose last result is older than --max_age")
+parser.add_argument('--max_age',type=int,default=incrementalMaxAge, help="Optional - secs a stored result is reused for with --incremental")
+parser.add_argument('--all_platforms',action="store_true", help="Optional - sends the CLI command to every device, including switches and models that don't support it")
+parser.add_argument('--power_details',action="store_true", help="Optional - adds the power source, PoE power status and power budget to the results")
+parser.add_argument('--verbose',action="store_true", help="Optional - prints the raw CLI output of every device")
+parser.add_argument('--log_json',action="store_true", help="Optional - writes PoE_log.log as JSON lines with the id of the API request each record belongs to")
+parser.add_argument('--no_history',action="store_true", help="Optional - does not add the results to the PoE_history.db history database")
+parser.add_argument('--history_changes',type=float,metavar='DAYS', help="Lists the devices whose power status changed in the last DAYS days from the history database and exits. Can be limited with --buildings")
+batch_group = parser.add_argument_group('batch mode', 'Runs without prompting when any of the building options are used')
+batch_group.add_argument('--token', help="XIQ API token, can also be set with the XIQ_TOKEN environment variable")
+batch_group.add_argument('--username', help="XIQ login email, the password is read from the XIQ_PASSWORD environment variable")
+batch_group.add_argument('--account', help="Name of the external VIQ account to check")
+batch_group.add_argument('--buildings', help="Comma separated list of building names to check")
+batch_group.add_argument('--building_file', help="File with one building name per line to check")
+batch_group.add_argument('--all_buildings', action="store_true", help="Check every building in the account")
+batch_group.add_argument('--output_dir', help="Folder the result files are written to, defaults to the script folder")
+parser.add_argument('--data_dir', help="Optional - folder PoE_log.log, PoE_history.db and the .xiq_cache folder are kept in, defaults to the script folder")
+parser.add_argument('--base_url', default=os.environ.get('XIQ_BASE_URL'), help="Optional - XIQ API address, defaults to https://api.extremecloudiq.com or the XIQ_BASE_URL environment variable")
+parser.add_argument('--profile', action="store_true", help="Optional - prints the time spent in each stage of the run with API call counts and p50/p95 latencies")
+parser.add_argument('--profile_output', help="Optional - file to save the run profile to")
+parser.add_argument('--profile_format', choices=['json', 'chrome'], default='json', help="Optional - format of --profile_output, json or a chrome trace (chrome://tracing), defaults to json")
+parser.add_argument('--output_format', default='csv', help=f"Optional - comma separated list of result file formats ({', '.join(WRITERS)}), defaults to csv")
+batch_group.add_argument('--consolidated', action="store_true", help="Write one report for all buildings instead of one CSV per building")
+batch_group.add_argument('--sweep_accounts', nargs='?', const='all', help="Check the main account and every external account, or a comma separated list of account names, in one report")
+batch_group.add_argument('--account_concurrency', type=int, default=accountConcurrency, help="Number of accounts checked at the same time when sweeping")
+watch_group = parser.add_argument_group('watch mode', 'Keeps running, re-checking the buildings on an interval and alerting when a power status changes')
+watch_group.add_argument('--watch', action="store_true", help="Re-check the buildings every --interval secs until stopped")
+watch_group.add_argument('--interval', type=float, default=watchInterval, help=f"Secs between checks, defaults to {watchInterval}")
+watch_group.add_argument('--inventory_interval', type=float, default=inventoryInterval, help=f"Secs between collecting the floors and devices again, defaults to {inventoryInterval}")
+watch_group.add_argument('--alert', action='append', help="Where power status changes are sent - stdout, file:<path> or a webhook url. Can be given more than once, defaults to stdout")
 args = parser.parse_args()
 
 PATH = current_dir
+DATA_PATH = args.data_dir or PATH
+os.makedirs(DATA_PATH, exist_ok=True)
+setupLogging(f"{DATA_PATH}/PoE_log.log", json_format=args.log_json)
+batch_mode = bool(args.buildings or args.building_file or args.all_buildings or args.sweep_accounts or args.watch)
+
+# every API call and stage of the run is timed, it is only reported with --profile or --profile_output
+profiler = RunProfiler()
+
+location_cache = None if args.no_location_cache else LocationCache(f"{DATA_PATH}/.xiq_cache/locations.json", ttl=locationCacheTTL)
+token_cache = None if args.no_token_cache else TokenCache(f"{DATA_PATH}/.xiq_cache/tokens.json", refresh_margin=tokenRefreshMargin)
+
+xiq_settings = {
+    'pool_size': poolSize,
+    'connect_timeout': connectTimeout,
+    'read_timeout': readTimeout,
+    'page_workers': pageWorkers,
+    'lro_first_poll': lroFirstPoll,
+    'lro_max_interval': lroMaxInterval,
+    'lro_timeout': lroTimeout,
+    'location_cache': location_cache,
+    'rate_limit': rateLimit,
+    'rate_burst': rateBurst,
+    'base_url': args.base_url,
+    'token_cache': token_cache,
+    'token_refresh_margin': tokenRefreshMargin,
+    'profiler': profiler
+}
 
 # Git Shell Coloring - https://gist.github.com/vratiu/9780109
 RED   = "\033[1;31m"  
@@ -46,16 +159,35 @@ def yesNoLoop(question):
             raise SystemExit
     return response
 
-if XIQ_API_token:
-    x = XIQ(token=XIQ_API_token)
-else:
-    print("Enter your XIQ login credentials")
-    username = input("Email: ")
-    password = getpass.getpass("Password: ")
-    x = XIQ(user_name=username,password = password)
+def exitScript(msg):
+    print(msg)
+    logger.error(msg)
+    print("script is exiting....")
+    raise SystemExit
 
-#OPTIONAL - use externally managed XIQ account
-if args.external:
+def login():
+    # the API client (and aiohttp) is only imported once it's needed, so --help and --history_changes start quickly
+    from app.xiq_api import XIQ
+    token = args.token or os.environ.get('XIQ_TOKEN') or XIQ_API_token
+    if token:
+        return XIQ(token=token, **xiq_settings)
+    if batch_mode:
+        username = args.username or os.environ.get('XIQ_USERNAME')
+        password = os.environ.get('XIQ_PASSWORD')
+        # a cached token for the user is enough, the password is still needed to renew it
+        if not username or not (password or (token_cache and token_cache.get(username))):
+            exitScript("Batch mode needs --token, XIQ_TOKEN or a username with the XIQ_PASSWORD environment variable")
+    else:
+        print("Enter your XIQ login credentials")
+        username = args.username or input("Email: ")
+        if token_cache and token_cache.get(username):
+            print(f"Using the saved login for {username}")
+            password = None
+        else:
+            password = getpass.getpass("Password: ")
+    return XIQ(user_name=username,password = password, **xiq_settings)
+
+def selectExternalAccount(x):
     accounts, viqName = x.selectManagedAccount()
     if accounts == 1:
         validResponse = False
@@ -72,11 +204,10 @@ if args.external:
         validResponse = False
         while validResponse != True:
             print("\nWhich VIQ would you like to import the floor plan and APs too?")
-            accounts_df = pd.DataFrame(accounts)
             count = 0
-            for df_id, viq_info in accounts_df.iterrows():
-                print(f"   {df_id}. {viq_info['name']}")
-                count = df_id
+            for account_id, viq_info in enumerate(accounts):
+                print(f"   {account_id}. {viq_info['name']}")
+                count = account_id
             print(f"   {count+1}. {viqName} (This is Your main account)\n")
             selection = input(f"Please enter 0 - {count+1}: ")
             try:
@@ -89,81 +220,519 @@ if args.external:
             if 0 <= selection <= count+1:
                 validResponse = True
                 if selection != count+1:
-                    newViqID = (accounts_df.loc[int(selection),'id'])
-                    newViqName = (accounts_df.loc[int(selection),'name'])
+                    newViqID = accounts[selection]['id']
+                    newViqName = accounts[selection]['name']
                     x.switchAccount(newViqID, newViqName)
                     logger.info(f"Logged into {newViqName}")
 
-# collect building name from user and get ids for any floors of the building
-building_search = True
-while building_search:
-    building = input("Please enter the name of the building: ")
-    print("Collecting Location information")
-    floor_list = x.getFloors(building)
-    if 'errors' in floor_list:
-        errors = ", ".join(floor_list['errors'])
-        print(errors)
-        logger.error(errors)
-        yesNoLoop = "would you like to try again?"
-        if yesNoLoop == 'n':
+def switchToAccount(x, account_name):
+    # non-interactive version of selectExternalAccount, matching the account by name
+    if x.switchToCachedAccount(account_name):
+        logger.info(f"Logged into {account_name} with a cached token")
+        return
+    accounts, viqName = x.selectManagedAccount()
+    if account_name == viqName:
+        return
+    if accounts == 1:
+        exitScript(f"Unable to collect external accounts to find {account_name}")
+    matches = [account for account in accounts if account['name'] == account_name]
+    if not matches:
+        exitScript(f"No external account was found with the name {account_name}")
+    x.switchAccount(matches[0]['id'], account_name)
+    logger.info(f"Logged into {account_name}")
+
+def promptBuilding(x):
+    # collect building name from user and get ids for any floors of the building
+    while True:
+        building = input("Please enter the name of the building: ")
+        print("Collecting Location information")
+        with profiler.phase('locations'):
+            floor_list = x.getFloors(building, refresh=args.refresh_locations)
+        if 'errors' in floor_list:
+            errors = ", ".join(floor_list['errors'])
+            print(errors)
+            logger.error(errors)
+            response = yesNoLoop("would you like to try again?")
+            if response == 'n':
+                print("script is exiting....")
+                raise SystemExit
+            print('\n')
+        else:
+            return building, floor_list
+
+def batchBuildings(x):
+    # (name, building record) for the buildings to check, the record is None for buildings given by name.
+    # With no buildings given (e.g. an account sweep) every building is checked
+    if args.all_buildings or not (args.buildings or args.building_file):
+        buildings = x.listBuildings(pageSize)
+        name_counts = {}
+        for building in buildings:
+            name_counts[building['name']] = name_counts.get(building['name'], 0) + 1
+        # buildings sharing a name are told apart by their id
+        return [(building['name'] if name_counts[building['name']] == 1 else f"{building['name']} ({building['id']})", building)
+                for building in buildings]
+    return [(name, None) for name in building_names]
+
+def readBuildingNames():
+    # building names from --buildings and --building_file, without blanks and repeats, in the given order
+    names = []
+    if args.buildings:
+        names += [name.strip() for name in args.buildings.split(',')]
+    if args.building_file:
+        try:
+            with open(args.building_file, 'r') as f:
+                names += [line.strip() for line in f]
+        except (OSError, UnicodeDecodeError) as e:
+            exitScript(f"Unable to read the building file {args.building_file}: {e}")
+    return list(dict.fromkeys(name for name in names if name))
+
+def resolveBuildings(x, targets):
+    # building -> floor list for (name, building record) pairs, buildings that can't be resolved are logged and skipped.
+    # Buildings from listBuildings already have their id, so only their floors are looked up
+    buildings = {}
+    print(f"Collecting Location information for {len(targets)} buildings")
+    with ThreadPoolExecutor(max_workers=floorConcurrency) as executor:
+        # each task runs in a copy of this thread's context so its API calls keep the profiler phase
+        futures = [executor.submit(contextvars.copy_context().run, x.getFloors, name, refresh=args.refresh_locations) if record is None
+                   else executor.submit(contextvars.copy_context().run, x.getBuildingFloors, record, name=name, refresh=args.refresh_locations)
+                   for name, record in targets]
+        floor_lists = (future.result() for future in futures)
+        for (building, _), floor_list in zip(targets, floor_lists):
+            if 'errors' in floor_list:
+                errors = ", ".join(floor_list['errors'])
+                print(errors)
+                logger.error(errors)
+            elif not floor_list:
+                msg = f"There was no floors associated with the building {building}"
+                print(msg)
+                logger.warning(msg)
+            else:
+                buildings[building] = floor_list
+    return buildings
+
+
+class FloorProgress:
+    # single progress line shared by all floors being collected at once
+    def __init__(self, floor_count):
+        self.floor_count = floor_count
+        self.floors_done = 0
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    def page(self, floor_id, page, pageCount):
+        with self.lock:
+            done, _ = self.pages.get(floor_id, (0, pageCount))
+            self.pages[floor_id] = (done + 1, pageCount)
+            self.__show()
+
+    def floor(self):
+        with self.lock:
+            self.floors_done += 1
+            self.__show()
+
+    def __show(self):
+        pages_done = sum(done for done, _ in self.pages.values())
+        pages_total = sum(total for _, total in self.pages.values())
+        print(f"Collected {self.floors_done} of {self.floor_count} floors - {pages_done} of {pages_total} known pages", end='\r')
+
+
+def collectBuildingDevices(x, buildings):
+    # the floors of every building are collected in one fan-out, each page goes straight into the returned DeviceInventory
+    floors = [(building, floor) for building, floor_list in buildings.items() for floor in floor_list]
+    print(f"Collecting Devices for {len(floors)} floors...")
+    progress = FloorProgress(len(floors))
+    inventory = DeviceInventory()
+    with ThreadPoolExecutor(max_workers=floorConcurrency) as executor:
+        fields = list(dict.fromkeys(deviceFields + fingerprintFields)) if args.incremental else deviceFields
+        futures = {executor.submit(contextvars.copy_context().run, x.collectDevices, pageSize, location_id=floor['id'], fields=fields,
+                                   progress=lambda page, pageCount, floor_id=floor['id']: progress.page(floor_id, page, pageCount),
+                                   on_page=lambda records, building=building: inventory.addPage(building, records)): (building, floor)
+                   for building, floor in floors}
+        # floors are handled as they finish so a slow floor does not hold up the others
+        for future in as_completed(futures):
+            building, floor = futures[future]
+            device_count = future.result()
+            progress.floor()
+            logger.info(f"Collected {device_count} devices for floor '{floor['name']}' in {building}")
+    print("\n\n")
+    return inventory
+
+
+def runPowerCheck(x, inventory, report, account=None, state=None, history=None, on_result=None):
+    # on_result(building, device, power_status) is called for every new result, not for reused or skipped devices
+    # one CLI workflow covers the devices of every building, results are split back out per building
+
+    # results are streamed to the report as they are produced rather than held in memory
+    def recordRows(building_rows):
+        with profiler.phase('results'):
+            for building, rows in building_rows.items():
+                report.write(building, rows, account=account)
+                if not batch_mode:
+                    for row in rows:
+                        print(f"{row[0]}: {row[1]}")
+
+    # the inventory is worked through a batch at a time to get the device ids for the cli command call.
+    # Devices that can't run the command are skipped and --incremental reuses recent results before anything is sent
+    id_list = []
+    reasons = {}
+    skipped_count = 0
+    cached_count = 0
+    for check_devices in inventory.chunks(cliBatchSize):
+        if not args.all_platforms:
+            check_devices, skipped = filterSupported(check_devices)
+            skipped_rows = {}
+            for device, reason in skipped:
+                reasons[reason] = reasons.get(reason, 0) + 1
+                skipped_rows.setdefault(device.building, []).append(resultRow(device, UNSUPPORTED_STATUS, details=args.power_details))
+                logger.info(f"Skipping {device.hostname} ({device.id}), {reason} does not support the power status command")
+            skipped_count += len(skipped)
+            recordRows(skipped_rows)
+        if state is not None:
+            check_devices, cached = state.split(check_devices)
+            cached_rows = {}
+            for device, power_status in cached:
+                cached_rows.setdefault(device.building, []).append(resultRow(device, power_status, details=args.power_details))
+            cached_count += len(cached)
+            recordRows(cached_rows)
+        id_list.extend(device.id for device in check_devices)
+    if skipped_count:
+        msg = f"Skipping {skipped_count} devices that can't report power status - " + ", ".join(f"{count} {reason}" for reason, count in reasons.items())
+        print(msg)
+        logger.info(msg)
+    if state is not None:
+        msg = f"Re-checking {len(id_list)} of {len(id_list) + cached_count} devices, reusing {cached_count} recent results"
+        print(msg)
+        logger.info(msg)
+
+    commands = ['show system power status']
+    failed_ids = []
+    unparsed = 0
+    # each batch is parsed and written as soon as it completes, while later batches are still running
+    batches = x.sendCLIBatches(id_list, commands, batch_size=cliBatchSize, max_in_flight=cliMaxInFlight) if id_list else []
+    for batch_ids, rawData in batches:
+        if not rawData:
+            # the devices of a failed batch are still listed, so the report covers the whole inventory
+            failed_ids.extend(batch_ids)
+            recordRows(failedRows(inventory, batch_ids, details=args.power_details))
+            continue
+        history_rows = {}
+        with profiler.phase('parse'):
+            if args.verbose:
+                for device_id, cli_outputs in rawData['device_cli_outputs'].items():
+                    print(f"{device_id}: {cli_outputs}")
+            results, errors = parseOutputs(rawData['device_cli_outputs'])
+            batch_rows, checked, batch_unparsed = assembleBatch(inventory, results, errors, details=args.power_details)
+            missing = [device_id for device_id in batch_ids if device_id not in results and device_id not in errors]
+            failed_ids.extend(missing)
+            for building, rows in failedRows(inventory, missing, details=args.power_details).items():
+                batch_rows.setdefault(building, []).extend(rows)
+            unparsed += batch_unparsed
+            for building, device, power_status in checked:
+                history_rows.setdefault(building, []).append((device.id, device.hostname, power_status))
+                if state is not None:
+                    state.update(device, power_status)
+                if on_result is not None:
+                    on_result(building, device, power_status)
+        recordRows(batch_rows)
+        # only new results go into the history, results reused by --incremental were recorded when first seen
+        if history is not None:
+            with profiler.phase('history'):
+                for building, rows in history_rows.items():
+                    history.record(building, rows, account=account)
+        print(f"Wrote results for {sum(len(rows) for rows in batch_rows.values())} devices")
+    if state is not None:
+        state.save()
+    if failed_ids:
+        msg = f"Failed to collect CLI output from {len(failed_ids)} devices, they are listed as {FAILED_STATUS}"
+        print(msg)
+        logger.warning(msg)
+    if unparsed:
+        msg = f"Unable to read the power status of {unparsed} devices, they are listed as {UNKNOWN_STATUS}"
+        print(msg)
+        logger.warning(msg)
+
+
+def collectInventory(x, account=None):
+    # DeviceInventory of the connected devices in the buildings given on the command line, or prompted for, in x's account
+    if batch_mode:
+        with profiler.phase('locations'):
+            targets = batchBuildings(x)
+            if not targets:
+                exitScript("No buildings were given to check")
+            buildings = resolveBuildings(x, targets)
+        if not buildings:
+            exitScript("None of the buildings could be found")
+    else:
+        building, floor_list = promptBuilding(x)
+        #Check floor list
+        if not floor_list:
+            msg = f"There was no floors associated with the building {building}"
+            print(msg)
+            logger.warning(msg)
             print("script is exiting....")
             raise SystemExit
-        print('\n')
-    else:
-        building_search = False
+        buildings = {building: floor_list}
+
+    with profiler.phase('devices'):
+        inventory = collectBuildingDevices(x, buildings)
+    if not len(inventory):
+        msg = "There were no devices found!"
+        logger.warning(msg)
+        print(msg)
+        print("script is exiting....")
+        raise SystemExit
 
+    counts = inventory.buildingCounts()
+    for building in buildings:
+        if building not in counts:
+            continue
+        msg = f"Collected {counts[building]} APs from location {building}"
+        if account:
+            msg += f" in account {account}"
+        print(msg)
+        logger.info(msg)
+    return inventory
 
-#Check floor list
-if not floor_list:
-    msg = f"There was no floors associated with the building {building}"
+def checkBuildings(x, report, account=None, history=None):
+    # runs the check against the buildings given on the command line, or prompted for, in x's account
+    inventory = collectInventory(x, account=account)
+    state = None
+    if args.incremental:
+        state = DeviceStateStore(f"{DATA_PATH}/.xiq_cache/device_state_{x.accountKey()}.json", max_age=args.max_age)
+    return runPowerCheck(x, inventory, report, account=account, state=state, history=history)
+
+def logConnectionStats(x, account=None):
+    stats = x.connectionStats()
+    metrics = x.schedulerMetrics()
+    msg = f"Made {stats['requests']} API requests over {stats['connections']} connections"
+    # account clients share x's scheduler, so its retries are only reported once for the whole sweep
+    if metrics['retries'] and not account:
+        msg += f" - {metrics['retries']} retries ({metrics['throttled']} throttled, {metrics['server_errors']} server errors, {metrics['timeouts']} timeouts)"
+    if account:
+        msg += f" for account {account}"
     print(msg)
-    logger.warning(msg)
-    print("script is exiting....")
-    raise SystemExit
-    
+    logger.info(msg)
 
-device_data = []
-for floor in floor_list:
-    print(f"Collecting Devices for floor '{floor['name']}'...")
-    ## Collect Devices
-    temp_data = x.collectDevices(pageSize,location_id=floor['id'])
-    device_data = device_data + temp_data
+def watchBuildings(x, watcher, history=None):
+    # checks the buildings every --interval secs until SIGTERM or Ctrl+C, reusing x's session and token.
+    # Each check overwrites the result files, so they always hold the latest results
+    stop = threading.Event()
 
-print("\n\n")
+    def requestStop(signum, frame):
+        # the first signal lets the current check finish, a second one stops straight away
+        if stop.is_set():
+            raise KeyboardInterrupt
+        print("\nStopping after the current check, press Ctrl+C again to stop now")
+        logger.info("Watch stop requested")
+        stop.set()
 
-if not device_data:
-    msg = "There were no devices found!"
-    logger.warning(msg)
-    print(msg)
-    print("script is exiting....")
+    signal.signal(signal.SIGTERM, requestStop)
+    signal.signal(signal.SIGINT, requestStop)
+    state = None
+    if args.incremental:
+        state = DeviceStateStore(f"{DATA_PATH}/.xiq_cache/device_state_{x.accountKey()}.json", max_age=args.max_age)
+    inventory = None
+    inventory_time = 0
+    cycle = 0
+    while not stop.is_set():
+        cycle += 1
+        cycle_start = time.monotonic()
+        try:
+            if inventory is None or cycle_start - inventory_time >= args.inventory_interval:
+                inventory = collectInventory(x)
+                inventory_time = cycle_start
+                watcher.forget(inventory.ids())
+            report = ResultReport(args.output_dir or PATH, args.consolidated, formats=output_formats, extra_columns=detail_columns)
+            try:
+                runPowerCheck(x, inventory, report, state=state, history=history, on_result=watcher.observe)
+            finally:
+                report.close()
+            printSummary(report)
+        except (Exception, SystemExit) as e:
+            # a failed inventory on the first check is a setup problem, later failures are retried next time
+            if inventory is None:
+                raise
+            msg = f"Check {cycle} failed, trying again at the next interval: {e!r}"
+            print(msg)
+            logger.error(msg)
+        logConnectionStats(x)
+        if args.profile:
+            profiler.printSummary()
+        # only the current check is profiled so a long watch doesn't build up call records
+        profiler.reset()
+        delay = max(0, args.interval * random.uniform(1 - watchJitter, 1 + watchJitter) - (time.monotonic() - cycle_start))
+        msg = f"Check {cycle} done, {watcher.event_count} power status changes so far. Next check in {delay:.0f} secs"
+        print(msg)
+        logger.info(msg)
+        stop.wait(delay)
+
+def sweepAccounts(x, report, history=None):
+    # every account gets its own token and XIQ client and is checked in parallel. The account clients run on
+    # x's event loop and share its scheduler, so the whole sweep stays within the one rate limit
+    with profiler.phase('accounts'):
+        accounts, viqName = x.selectManagedAccount()
+    if accounts == 1:
+        exitScript("Unable to collect the external accounts to sweep")
+    targets = [(viqName, None)] + [(account['name'], account['id']) for account in accounts]
+    if args.sweep_accounts != 'all':
+        names = [name.strip() for name in args.sweep_accounts.split(',')]
+        missing = set(names) - {name for name, _ in targets}
+        if missing:
+            msg = f"No account was found with the name {', '.join(sorted(missing))}"
+            print(msg)
+            logger.warning(msg)
+        targets = [(name, viqID) for name, viqID in targets if name in names]
+
+    from app.xiq_api import XIQ
+
+    def runAccount(name, viqID):
+        with profiler.phase('accounts'):
+            token = x.currentToken() if viqID is None else x.getAccountToken(viqID, name)
+        account_x = XIQ(token=token, parent=x, **xiq_settings)
+        try:
+            return checkBuildings(account_x, report, account=name, history=history)
+        finally:
+            logConnectionStats(account_x, account=name)
+            account_x.close()
+
+    checked_accounts = []
+    failed_accounts = []
+    with ThreadPoolExecutor(max_workers=max(1, args.account_concurrency)) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, runAccount, name, viqID): name for name, viqID in targets}
+        # accounts are handled as they finish so one slow account does not hold up the rest
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+                checked_accounts.append(name)
+            except (Exception, SystemExit) as e:
+                failed_accounts.append(name)
+                logger.error(f"Checking account {name} failed {e}")
+    if failed_accounts:
+        msg = f"Failed to check accounts {', '.join(failed_accounts)}"
+        print(msg)
+        logger.warning(msg)
+    if not checked_accounts:
+        exitScript("No accounts could be checked")
+
+
+def printTable(columns, rows):
+    # plain text table so printing results doesn't need pandas, numbers are right aligned
+    rows = [['' if value is None else value for value in row] for row in rows]
+    widths = [max(len(str(value)) for value in [column] + [row[i] for row in rows]) for i, column in enumerate(columns)]
+    numeric = [all(isinstance(row[i], (int, float)) for row in rows) for i in range(len(columns))]
+    for row in [columns] + rows:
+        print("  ".join(str(value).rjust(width) if is_number else str(value).ljust(width)
+                        for value, width, is_number in zip(row, widths, numeric)).rstrip())
+
+def printHistoryChanges(history, days):
+    # lists the power status changes of the last days days from the history database
+    buildings = [name.strip() for name in args.buildings.split(',')] if args.buildings else None
+    changes = history.changes(days, buildings=buildings) if history else []
+    if not changes:
+        print(f"No devices changed power status in the last {days:g} days")
+    else:
+        rows = [(time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts)),) + tuple(change) for ts, *change in changes]
+        printTable(['Time', 'Account', 'Building', 'Device ID', 'Device', 'Old Status', 'New Status'], rows)
+
+def printSummary(report, by_account=False):
+    # a count of each power status per building (and account), built from the report's counts
+    summary = {}
+    statuses = []
+    for (account, building, power_status), count in sorted(report.summary().items(), key=lambda item: tuple(map(str, item[0]))):
+        row = (account, building) if by_account else (building,)
+        summary.setdefault(row, {})[power_status] = count
+        if power_status not in statuses:
+            statuses.append(power_status)
+    print("\n")
+    if not summary:
+        print("No results were collected")
+        return
+    index = ['Account', 'Building'] if by_account else ['Building']
+    printTable(index + statuses, [list(row) + [counts.get(status, 0) for status in statuses] for row, counts in summary.items()])
+
+def reportProfile():
+    if args.profile:
+        profiler.printSummary()
+    if args.profile_output:
+        profiler.export(args.profile_output, args.profile_format)
+
+
+## startup - everything below runs from the command line arguments
+
+detail_columns = [column for _, column in DETAIL_FIELDS] if args.power_details else []
+output_formats = [output_format.strip().lower() for output_format in args.output_format.split(',') if output_format.strip()]
+history = None if args.no_history else PoEHistory(f"{DATA_PATH}/PoE_history.db")
+if history is not None:
+    # closed by atexit so every early exit closes it as well
+    atexit.register(history.close)
+
+if args.history_changes is not None:
+    printHistoryChanges(history, args.history_changes)
     raise SystemExit
 
-msg = f"Collected {len(device_data)} APs from location {building}"
-print(msg)
-logger.info(msg)
-
-# convert device_data dict to dataframe
-device_df = pd.DataFrame(device_data)
-device_df.set_index('id',inplace=True)
-# get list of device ids for cli command call
-id_list = [sub['id'] for sub in device_data ]
-
-commands = ['show system power status']
-if id_list:
-    csv_df = pd.DataFrame(columns = ['Device', 'Power Status'])
-    rawData = x.sendCLI(id_list, commands)
-    for device_id in rawData['device_cli_outputs']:
-        print(rawData['device_cli_outputs'][device_id])
-        output = rawData['device_cli_outputs'][device_id][0]['output']
-        output_regex = re.compile(r'System\sPower\sStatus:\s+(\w+)')
-        power_status = output_regex.findall(output)[0]
-        devicename = device_df.loc[int(device_id),'hostname']
-        #print(devicename, power_status)
-        temp_df = pd.DataFrame([{'Device': devicename, 'Power Status': power_status}])
-        csv_df = pd.concat([csv_df, temp_df], ignore_index=True)
-
-print("\n")
-print(csv_df)
-filename = f"{building}_PoE_Check.csv"
-print(f"Writing CSV File {filename}")
-csv_df.to_csv(f"{PATH}/{filename}", index=False)
\ No newline at end of file
+try:
+    # opens nothing yet, but checks the formats and their optional packages before logging in
+    ResultReport(args.output_dir or PATH, args.consolidated, formats=output_formats, extra_columns=detail_columns)
+except (ValueError, ImportError) as e:
+    print(e)
+    raise SystemExit
+if args.watch:
+    try:
+        alert_sinks = [parseSink(spec) for spec in args.alert or ['stdout']]
+    except (ValueError, OSError) as e:
+        print(e)
+        raise SystemExit
+    if args.sweep_accounts:
+        exitScript("--watch checks a single account and can't be used with --sweep_accounts")
+# the building list is read before logging in, so a missing or empty building file is reported straight away
+building_names = [] if args.all_buildings else readBuildingNames()
+if (args.buildings or args.building_file) and not args.all_buildings and not building_names:
+    exitScript("No buildings were given to check")
+
+# registered with atexit so the profile is also reported when the script exits early
+if args.profile or args.profile_output:
+    atexit.register(reportProfile)
+
+with profiler.phase('login'):
+    x = login()
+# closed by atexit so the session is also closed when the script exits early - a building that isn't found,
+# a failed API call or Ctrl+C. It is registered after reportProfile so it runs before it
+atexit.register(x.close)
+
+if args.watch:
+    if args.account:
+        with profiler.phase('accounts'):
+            switchToAccount(x, args.account)
+    if not x.canRenewToken():
+        logger.warning("Watching with a token that can't be renewed, the watch will stop working when it expires")
+    # statuses from the history carry on from the last run, so a change while the watch was stopped is still alerted
+    watcher = StatusWatcher(alert_sinks, initial=history.latestStatuses() if history else None)
+    try:
+        watchBuildings(x, watcher, history=history)
+    finally:
+        watcher.close()
+elif args.sweep_accounts:
+    # accounts are always merged into one report tagged by account
+    report = ResultReport(args.output_dir or PATH, True, formats=output_formats, tag_account=True, extra_columns=detail_columns)
+    try:
+        sweepAccounts(x, report, history=history)
+    finally:
+        report.close()
+    printSummary(report, by_account=True)
+else:
+    #OPTIONAL - use externally managed XIQ account
+    if args.account:
+        with profiler.phase('accounts'):
+            switchToAccount(x, args.account)
+    elif args.external:
+        selectExternalAccount(x)
+
+    report = ResultReport(args.output_dir or PATH, args.consolidated, formats=output_formats, extra_columns=detail_columns)
+    try:
+        checkBuildings(x, report, history=history)
+    finally:
+        report.close()
+    printSummary(report)
+
+logConnectionStats(x)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.request
+import urllib.error
+
+logger = logging.getLogger('PoE_Check.alerts')
+
+
+class AlertSink:
+    """Receives power status change events, dicts with time, account, building, device_id,
+    hostname, old_status and new_status. A failing sink is logged and never stops the watch."""
+    def send(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class StdoutSink(AlertSink):
+    def send(self, event):
+        print(f"POWER STATUS CHANGE {event['hostname']} ({event['building']}): {event['old_status']} -> {event['new_status']}")
+        sys.stdout.flush()
+
+
+class FileSink(AlertSink):
+    # appends one JSON event per line
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a')
+
+    def send(self, event):
+        self.file.write(json.dumps(event) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class WebhookSink(AlertSink):
+    # POSTs each event as JSON to the url
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, event):
+        request = urllib.request.Request(self.url, data=json.dumps(event).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def parseSink(spec):
+    """'stdout', 'file:<path>' or an http(s) webhook url"""
+    if spec == 'stdout':
+        return StdoutSink()
+    if spec.startswith('file:'):
+        return FileSink(spec[len('file:'):])
+    if spec.startswith(('http://', 'https://')):
+        return WebhookSink(spec)
+    raise ValueError(f"Unknown alert destination {spec}, use stdout, file:<path> or a webhook url")
+
+
+class StatusWatcher:
+    """Remembers the last power status of every device and sends an event to each sink when it
+    changes. The first status seen for a device is only remembered. forget() drops devices that
+    are no longer in the inventory so memory stays bounded by the device count."""
+    def __init__(self, sinks, initial=None):
+        self.sinks = sinks
+        # (account, device id) -> power status
+        self.statuses = dict(initial or {})
+        self.lock = threading.Lock()
+        self.event_count = 0
+
+    def observe(self, building, device, power_status, account=None):
+        key = (account or '', device['id'])
+        with self.lock:
+            old_status = self.statuses.get(key)
+            self.statuses[key] = power_status
+        if old_status is None or old_status == power_status:
+            return
+        event = {
+            'time': int(time.time()),
+            'account': account or '',
+            'building': building,
+            'device_id': device['id'],
+            'hostname': device['hostname'],
+            'old_status': old_status,
+            'new_status': power_status
+        }
+        self.event_count += 1
+        logger.info(f"{device['hostname']} in {building} changed power status from {old_status} to {power_status}")
+        for sink in self.sinks:
+            try:
+                sink.send(event)
+            except (OSError, urllib.error.URLError, ValueError) as e:
+                logger.error(f"Failed to send power status change to {type(sink).__name__}: {e}")
+
+    def forget(self, device_ids, account=None):
+        # keeps only the given devices of the account
+        keep = {(account or '', device_id) for device_id in device_ids}
+        with self.lock:
+            for key in [key for key in self.statuses if key[0] == (account or '') and key not in keep]:
+                del self.statuses[key]
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# device record fields needed to decide if a device can run the power status command
+CAPABILITY_FIELDS = ['DEVICE_FUNCTION']
+
+# 'show system power status' is an IQ Engine AP command, switches and other device functions don't have it
+SUPPORTED_FUNCTIONS = {'AP'}
+
+
+def unsupportedReason(device):
+    """Returns why the power status command can't be sent to the device, or None if it can.
+    Devices without a device function are sent the command."""
+    function = (device.get('device_function') or '').upper()
+    if function and function not in SUPPORTED_FUNCTIONS:
+        return f"device function {function}"
+    return None
+
+
+def filterSupported(devices):
+    """Splits device records into (supported, skipped), skipped is a list of (device, reason)."""
+    supported = []
+    skipped = []
+    for device in devices:
+        reason = unsupportedReason(device)
+        if reason is None:
+            supported.append(device)
+        else:
+            skipped.append((device, reason))
+    return supported, skipped
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import logging
+import re
+
+logger = logging.getLogger('PoE_Check.cli_parser')
+
+# the power status is the first word of this line, as it always has been in the reports
+status_regex = re.compile(r'System\sPower\sStatus:\s+(\w+)')
+# every other 'Name:   value' line of the output is kept as a field named e.g. power_source
+field_regex = re.compile(r'^[ \t]*([A-Za-z][\w ()/.-]*?)[ \t]*:[ \t]*(\S.*?)[ \t]*$', re.MULTILINE)
+
+# fields added to the report with --power_details, as (field, column name)
+DETAIL_FIELDS = [('power_source', 'Power Source'), ('poe_power_status', 'PoE Power Status'), ('power_budget', 'Power Budget')]
+
+
+def fieldName(label):
+    return re.sub(r'\W+', '_', label.strip().lower()).strip('_')
+
+
+def parseOutput(cli_outputs):
+    """Returns the power fields from one device's list of CLI outputs. 'status' is always set,
+    ValueError is raised with the reason when there is no power status in the output."""
+    if not cli_outputs:
+        raise ValueError("no CLI output was returned")
+    output = "\n".join(entry.get('output') or '' for entry in cli_outputs)
+    match = status_regex.search(output)
+    if match is None:
+        response_codes = ", ".join(str(entry.get('response_code')) for entry in cli_outputs)
+        raise ValueError(f"no power status in the output (response {response_codes}): {output[:200]!r}")
+    fields = {fieldName(label): value for label, value in field_regex.findall(output)}
+    fields['status'] = match.group(1)
+    return fields
+
+
+def parseOutputs(device_cli_outputs):
+    """Parses the device_cli_outputs map of a CLI long-running operation in one pass. Returns
+    (results, errors) - {device id: fields} and {device id: reason}, keyed by int id. A device whose
+    output can't be parsed gets an entry in the errors instead of stopping the parse, and output
+    under a key that isn't a device id is logged and skipped."""
+    results = {}
+    errors = {}
+    for key, cli_outputs in device_cli_outputs.items():
+        try:
+            device_id = int(key)
+        except (ValueError, TypeError):
+            logger.warning(f"Ignoring CLI output for the invalid device id {key!r}")
+            continue
+        try:
+            results[device_id] = parseOutput(cli_outputs)
+        except (ValueError, TypeError, AttributeError) as e:
+            errors[device_id] = str(e)
+    return results, errors
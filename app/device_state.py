@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import threading
+import time
+
+from app.json_store import loadJSON, saveJSON
+
+# device record fields that make up the fingerprint, a change in any of them means the device is re-checked
+FINGERPRINT_FIELDS = ['hostname', 'last_connect_time', 'software_version', 'product_type']
+
+
+def deviceFingerprint(device):
+    return "|".join(str(device.get(field, '')) for field in FINGERPRINT_FIELDS)
+
+
+class DeviceStateStore:
+    """On-disk record of the last power status seen for each device of one account.
+
+    Each device id maps to the fingerprint of its device record, its power status and when it
+    was checked. A device needs a new check when it is new, its fingerprint has changed or the
+    stored result is older than max_age seconds.
+    """
+    def __init__(self, path, max_age=6*60*60):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.devices = loadJSON(path, 'device state')
+
+    def save(self):
+        with self.lock:
+            saveJSON(self.path, self.devices)
+
+    def split(self, devices):
+        """Returns (to_check, cached) - the device records that need the CLI command sent and
+        (device, power_status) pairs for the devices whose stored result can be reused."""
+        now = time.time()
+        to_check = []
+        cached = []
+        for device in devices:
+            entry = self.devices.get(str(device['id']))
+            if (entry is None or entry['fingerprint'] != deviceFingerprint(device)
+                    or now - entry['checked'] > self.max_age):
+                to_check.append(device)
+            else:
+                cached.append((device, entry['status']))
+        return to_check, cached
+
+    def update(self, device, power_status):
+        with self.lock:
+            self.devices[str(device['id'])] = {
+                'fingerprint': deviceFingerprint(device),
+                'status': power_status,
+                'checked': time.time()
+            }
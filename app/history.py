@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('PoE_Check.history')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS poe_status (
+    ts INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    building TEXT NOT NULL,
+    device_id INTEGER NOT NULL,
+    hostname TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS poe_status_device ON poe_status (building, device_id, ts);
+CREATE INDEX IF NOT EXISTS poe_status_ts ON poe_status (ts);
+
+CREATE TABLE IF NOT EXISTS poe_latest (
+    account TEXT NOT NULL,
+    building TEXT NOT NULL,
+    device_id INTEGER NOT NULL,
+    status TEXT,
+    ts INTEGER NOT NULL,
+    PRIMARY KEY (account, building, device_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS poe_changes (
+    ts INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    building TEXT NOT NULL,
+    device_id INTEGER NOT NULL,
+    hostname TEXT,
+    old_status TEXT,
+    new_status TEXT
+);
+CREATE INDEX IF NOT EXISTS poe_changes_ts ON poe_changes (ts);
+CREATE INDEX IF NOT EXISTS poe_changes_building ON poe_changes (building, ts);
+"""
+
+
+class PoEHistory:
+    """Append-only SQLite store of every power status result.
+
+    Each result is added to poe_status. poe_latest holds the last status of every device, so a
+    status change can be spotted when it is written and added to poe_changes. Queries over
+    changes then only read the small, time-indexed poe_changes table however large poe_status gets.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def record(self, building, rows, account=None, ts=None):
+        # rows are (device_id, hostname, status)
+        ts = int(ts or time.time())
+        account = account or ''
+        rows = list(rows)
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT INTO poe_status (ts, account, building, device_id, hostname, status) VALUES (?, ?, ?, ?, ?, ?)",
+                                  ((ts, account, building, device_id, hostname, status) for device_id, hostname, status in rows))
+            latest = {}
+            for i in range(0, len(rows), 500):
+                ids = [row[0] for row in rows[i:i + 500]]
+                query = (f"SELECT device_id, status FROM poe_latest WHERE account = ? AND building = ? "
+                         f"AND device_id IN ({','.join('?' * len(ids))})")
+                latest.update(self.conn.execute(query, [account, building] + ids))
+            changes = [(ts, account, building, device_id, hostname, latest[device_id], status)
+                       for device_id, hostname, status in rows
+                       if device_id in latest and latest[device_id] != status]
+            self.conn.executemany("INSERT INTO poe_changes (ts, account, building, device_id, hostname, old_status, new_status) VALUES (?, ?, ?, ?, ?, ?, ?)", changes)
+            self.conn.executemany("INSERT INTO poe_latest (account, building, device_id, status, ts) VALUES (?, ?, ?, ?, ?) "
+                                  "ON CONFLICT (account, building, device_id) DO UPDATE SET status = excluded.status, ts = excluded.ts",
+                                  ((account, building, device_id, status, ts) for device_id, _, status in rows))
+        if changes:
+            logger.info(f"{len(changes)} devices in {building} changed power status")
+
+    def changes(self, days, buildings=None):
+        """Returns (time, account, building, device id, hostname, old status, new status) for every
+        status change in the last days days, optionally only for the given buildings."""
+        since = int(time.time() - days * 24 * 60 * 60)
+        query = "SELECT ts, account, building, device_id, hostname, old_status, new_status FROM poe_changes WHERE ts >= ?"
+        params = [since]
+        if buildings:
+            query += f" AND building IN ({','.join('?' * len(buildings))})"
+            params += list(buildings)
+        query += " ORDER BY ts"
+        with self.lock:
+            return self.conn.execute(query, params).fetchall()
+
+    def latestStatuses(self):
+        # {(account, device id): last power status} of every device in the history
+        with self.lock:
+            return {(account, device_id): status for account, device_id, status
+                    in self.conn.execute("SELECT account, device_id, status FROM poe_latest")}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import sys
+import threading
+
+# device record fields kept in the inventory, any other field of the API record is dropped
+DEVICE_FIELDS = ('id', 'hostname', 'device_function', 'product_type', 'software_version', 'last_connect_time')
+# fields with only a few distinct values across a tenant, their strings are interned so every device shares them
+SHARED_FIELDS = ('device_function', 'product_type', 'software_version')
+
+
+class Device:
+    """Compact record of one device, with the building it was collected for.
+
+    Can be read like the API's device dict (device['hostname'], device.get('product_type')) so it
+    can be passed to the same helpers. A field the API didn't return is left unset, so get()
+    returns the default for it just as it did for the dict.
+    """
+    __slots__ = DEVICE_FIELDS + ('building',)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def __repr__(self):
+        return f"Device({getattr(self, 'id', None)}, {getattr(self, 'hostname', None)!r}, {getattr(self, 'building', None)!r})"
+
+
+class DeviceInventory:
+    """Devices of the buildings being checked, filled a page at a time as they are collected.
+
+    Only the fields in DEVICE_FIELDS are kept, in slotted Device records, so a 100k device tenant
+    doesn't hold on to the full API payloads. Devices can be looked up by id or hostname, and are
+    iterated in the order they were added. A device id seen again replaces the earlier record.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.hostnames = {}
+        # building -> device count
+        self.counts = {}
+
+    def addPage(self, building, records):
+        # adds the API device records of one page, returns how many were added
+        building = sys.intern(building)
+        with self.lock:
+            for record in records:
+                device = Device()
+                for field in DEVICE_FIELDS:
+                    if field in record:
+                        value = record[field]
+                        if field in SHARED_FIELDS and isinstance(value, str):
+                            value = sys.intern(value)
+                        setattr(device, field, value)
+                device.building = building
+                self.__remove(device.id)
+                self.devices[device.id] = device
+                if device.get('hostname') is not None:
+                    self.hostnames[device.hostname] = device
+                self.counts[building] = self.counts.get(building, 0) + 1
+        return len(records)
+
+    def __remove(self, device_id):
+        old = self.devices.pop(device_id, None)
+        if old is None:
+            return
+        if self.hostnames.get(old.get('hostname')) is old:
+            del self.hostnames[old.hostname]
+        self.counts[old.building] -= 1
+        if not self.counts[old.building]:
+            del self.counts[old.building]
+
+    def get(self, device_id):
+        return self.devices.get(device_id)
+
+    def byHostname(self, hostname):
+        return self.hostnames.get(hostname)
+
+    def ids(self):
+        return self.devices.keys()
+
+    def buildingCounts(self):
+        # building -> device count, buildings without devices are left out
+        return dict(self.counts)
+
+    def chunks(self, size):
+        # lists of up to size devices, so a check can work through the inventory a batch at a time
+        chunk = []
+        for device in self.devices.values():
+            chunk.append(device)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __contains__(self, device_id):
+        return device_id in self.devices
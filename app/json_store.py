@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+
+logger = logging.getLogger('PoE_Check.json_store')
+
+
+def loadJSON(path, what):
+    # contents of a JSON file, or an empty dict if it doesn't exist or can't be read. what names the file in the warning
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable {what} {path}: {e}")
+        return {}
+
+
+def saveJSON(path, data, mode=None):
+    """Writes data to path atomically, through a temporary file that then replaces it.
+
+    With mode the file is created with those permissions, and a missing folder with 0700,
+    rather than chmod'ed afterwards so the contents are never readable by others.
+    """
+    os.makedirs(os.path.dirname(path), mode=0o777 if mode is None else 0o700, exist_ok=True)
+    tmp_path = path + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666 if mode is None else mode)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+
+from app.json_store import loadJSON, saveJSON
+
+logger = logging.getLogger('PoE_Check.location_cache')
+
+
+class LocationCache:
+    """On-disk cache of building -> floor lookups, keyed by XIQ API address, account and building name.
+
+    Entries older than ttl seconds are treated as missing. The whole cache is one JSON file
+    that is rewritten atomically on every change.
+    """
+    def __init__(self, path, ttl=24*60*60):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = self.__load()
+
+    def __load(self):
+        entries = loadJSON(self.path, 'location cache')
+        # entries saved before the API address was part of the key can't be told apart between hosts
+        return {key: entry for key, entry in entries.items() if key.count('|') >= 2}
+
+    def __save(self):
+        saveJSON(self.path, self.entries)
+
+    @staticmethod
+    def __key(host, account, building):
+        return f"{host}|{account}|{building}"
+
+    def get(self, account, building, host=''):
+        with self.lock:
+            entry = self.entries.get(self.__key(host, account, building))
+        if entry is None:
+            return None
+        if self.ttl is not None and time.time() - entry['timestamp'] > self.ttl:
+            logger.info(f"Location cache for {building} has expired")
+            return None
+        return entry
+
+    def set(self, account, building, building_id, floors, host=''):
+        with self.lock:
+            self.entries[self.__key(host, account, building)] = {
+                'timestamp': time.time(),
+                'building': {'id': building_id, 'name': building},
+                'floors': floors
+            }
+            self.__save()
+
+    def invalidate(self, account=None, building=None, host=None):
+        # with no arguments every entry is removed, otherwise only the matching host, account and/or building
+        with self.lock:
+            for key in list(self.entries):
+                entry_host, entry_account, entry_building = key.split('|', 2)
+                if host is not None and entry_host != host:
+                    continue
+                if account is not None and entry_account != str(account):
+                    continue
+                if building is not None and entry_building != building:
+                    continue
+                del self.entries[key]
+            self.__save()
@@ -1,25 +1,125 @@
 #!/usr/bin/env python3
+import atexit
+import contextvars
+import copy
+import itertools
+import json
 import logging
 import os
 import inspect
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parent_dir = os.path.dirname(current_dir)
 
 PATH = os.path.dirname(os.path.abspath(__file__))
 
-log_formatter = logging.Formatter('%(asctime)s: %(name)s - %(levelname)s - %(message)s')
+# messages longer than this are cut down before they are queued, so large API payloads can't flood the log
+maxMessageSize = 4096
 
-logFile = '{}/PoE_log.log'.format(parent_dir)
+# id of the API request the current thread or asyncio task is making, added to its log records
+request_id = contextvars.ContextVar('request_id', default=None)
+request_counter = itertools.count(1)
+
+
+def newRequestId():
+    return f"{os.getpid():x}-{next(request_counter):06d}"
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds request_id to every record and truncates messages over max_size characters.
+    It runs on the logging thread, before the record is queued."""
+    def __init__(self, max_size=maxMessageSize):
+        super().__init__()
+        self.max_size = max_size
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        message = record.getMessage()
+        if len(message) > self.max_size:
+            record.msg = f"{message[:self.max_size]}... [{len(message) - self.max_size} more characters not logged]"
+            record.args = None
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    # one JSON object per line
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        if getattr(record, 'request_id', None):
+            data['request_id'] = record.request_id
+        exception = record.exc_text or (self.formatException(record.exc_info) if record.exc_info else None)
+        if exception:
+            data['exception'] = exception
+        return json.dumps(data)
 
-my_handler = RotatingFileHandler(logFile, mode='a', maxBytes=50*1024*1024, 
-                                 backupCount=5, encoding=None, delay=0)
 
-my_handler.setFormatter(log_formatter)
-my_handler.setLevel(logging.INFO)
+class RecordQueueHandler(QueueHandler):
+    """QueueHandler that keeps a record's traceback in exc_text rather than adding it to the message,
+    so the JSON formatter can write it as its own field. The text formatter still appends it."""
+    def prepare(self, record):
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        message = record.getMessage()
+        # exc_info holds the traceback, which can't go through the queue to the listener thread
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+log_formatter = logging.Formatter('%(asctime)s: %(name)s - %(levelname)s - %(message)s')
+
+logFile = '{}/PoE_log.log'.format(parent_dir)
 
 logger = logging.getLogger('root')
 logger.setLevel(logging.INFO)
 
-logger.addHandler(my_handler)
+# records are put on a queue and written to the file by a background thread, so logging
+# never waits on file I/O in the event loop or the worker threads
+log_queue = queue.SimpleQueue()
+queue_handler = RecordQueueHandler(log_queue)
+queue_handler.addFilter(RequestContextFilter())
+log_listener = None
+file_handler = None
+
+
+def setupLogging(path=logFile, json_format=False):
+    """Starts writing log records to the rotating log file, as JSON lines with the request id of
+    each record when json_format is set. Nothing is logged to the file until this is called, so
+    importing the app modules doesn't start a thread or open a file."""
+    global log_listener, file_handler
+    if log_listener is not None:
+        return
+    # delay opens the log file on the first record instead of straight away
+    file_handler = RotatingFileHandler(path, mode='a', maxBytes=50*1024*1024,
+                                       backupCount=5, encoding=None, delay=True)
+    file_handler.setFormatter(JSONFormatter() if json_format else log_formatter)
+    file_handler.setLevel(logging.INFO)
+    log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    log_listener.start()
+    logger.addHandler(queue_handler)
+    # stopping the listener writes out any records still on the queue
+    atexit.register(stopLogging)
+
+
+def stopLogging():
+    global log_listener, file_handler
+    if log_listener is None:
+        return
+    logger.removeHandler(queue_handler)
+    log_listener.stop()
+    file_handler.close()
+    log_listener = None
+    file_handler = None
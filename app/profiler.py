@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('PoE_Check.profiler')
+
+# the stage the current thread or asyncio task is in, every HTTP call is tagged with it
+current_phase = contextvars.ContextVar('current_phase', default=None)
+
+
+def percentile(values, pct):
+    # nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+async def inPhase(coro, phase):
+    # runs coro in the given phase, used to carry the phase of a calling thread onto the event loop
+    current_phase.set(phase)
+    return await coro
+
+
+class RunProfiler:
+    """Records the timing of every XIQ HTTP call and every stage of a run.
+
+    Stages are timed with phase(), which nests, and calls made inside a stage are tagged with the
+    innermost phase. The run can be summarised per phase with p50/p95 call latencies, or exported
+    as JSON or a Chrome trace (chrome://tracing, https://ui.perfetto.dev) to compare runs.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.start_time = time.time()
+        self.calls = []
+        self.stages = []
+        self.lock = threading.Lock()
+
+    def reset(self):
+        # drops the recorded calls and stages, e.g. between the checks of a long-running watch
+        with self.lock:
+            self.start = time.perf_counter()
+            self.start_time = time.time()
+            self.calls = []
+            self.stages = []
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    @contextmanager
+    def phase(self, name):
+        token = current_phase.set(name)
+        start = self.now()
+        try:
+            yield
+        finally:
+            current_phase.reset(token)
+            with self.lock:
+                self.stages.append({'phase': name, 'start': start, 'duration': self.now() - start,
+                                    'thread': threading.get_ident()})
+
+    def recordCall(self, method, endpoint, status, start, latency, total, size, retries, error=None, request_id=None):
+        """start is from now(), latency is the last attempt and total includes retries and time
+        waiting on the rate limiter."""
+        call = {'phase': current_phase.get() or 'other', 'method': method, 'endpoint': endpoint, 'status': status,
+                'start': start, 'latency': latency, 'total': total, 'bytes': size, 'retries': retries,
+                'thread': threading.get_ident(), 'request_id': request_id}
+        if error is not None:
+            call['error'] = repr(error)
+        with self.lock:
+            self.calls.append(call)
+
+    def summary(self):
+        """Returns {phase: stats} with the phase wall time, call count, bytes, retries and
+        p50/p95/max call latency in secs, in the order the phases first started."""
+        with self.lock:
+            calls = list(self.calls)
+            stages = sorted(self.stages, key=lambda stage: stage['start'])
+        phases = {}
+        for stage in stages:
+            phase = phases.setdefault(stage['phase'], {'stages': 0, 'wall': 0.0})
+            phase['stages'] += 1
+            phase['wall'] += stage['duration']
+        latencies = {}
+        for call in calls:
+            phase = phases.setdefault(call['phase'], {'stages': 0, 'wall': 0.0})
+            phase['calls'] = phase.get('calls', 0) + 1
+            phase['bytes'] = phase.get('bytes', 0) + (call['bytes'] or 0)
+            phase['retries'] = phase.get('retries', 0) + call['retries']
+            latencies.setdefault(call['phase'], []).append(call['total'])
+        for name, phase in phases.items():
+            values = sorted(latencies.get(name, []))
+            phase.setdefault('calls', 0)
+            phase.setdefault('bytes', 0)
+            phase.setdefault('retries', 0)
+            phase['p50'] = percentile(values, 50)
+            phase['p95'] = percentile(values, 95)
+            phase['max'] = values[-1] if values else None
+        return phases
+
+    def printSummary(self):
+        def ms(value):
+            return '-' if value is None else f"{value * 1000:.0f}"
+        # stage time is summed over every stage of a phase, so phases run in parallel (e.g. CLI batches) can exceed the run time
+        print(f"\nRun profile - {self.now():.2f} secs")
+        print(f"{'phase':<14}{'stage s':>9}{'calls':>7}{'retries':>8}{'KB':>9}{'p50 ms':>8}{'p95 ms':>8}{'max ms':>8}")
+        for name, phase in self.summary().items():
+            line = (f"{name:<14}{phase['wall']:>9.2f}{phase['calls']:>7}{phase['retries']:>8}{phase['bytes'] / 1024:>9.0f}"
+                    f"{ms(phase['p50']):>8}{ms(phase['p95']):>8}{ms(phase['max']):>8}")
+            print(line)
+            logger.info(f"Profile {line}")
+
+    def export(self, path, output_format='json'):
+        with self.lock:
+            calls = list(self.calls)
+            stages = list(self.stages)
+        if output_format == 'chrome':
+            data = self.__chromeTrace(calls, stages)
+        elif output_format == 'json':
+            data = {'started': self.start_time, 'duration': self.now(), 'summary': self.summary(),
+                    'stages': stages, 'calls': calls}
+        else:
+            raise ValueError(f"Unknown profile format {output_format}, use json or chrome")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        print(f"Wrote run profile to {path}")
+        logger.info(f"Wrote run profile to {path}")
+
+    def __chromeTrace(self, calls, stages):
+        # stages are complete ('X') events on the thread that ran them, times are in microseconds.
+        # calls overlap on the event loop thread so they are async ('b'/'e') events, which get their own rows
+        pid = os.getpid()
+        events = [{'name': stage['phase'], 'cat': 'stage', 'ph': 'X', 'ts': stage['start'] * 1e6,
+                   'dur': stage['duration'] * 1e6, 'pid': pid, 'tid': stage['thread']} for stage in stages]
+        for call_id, call in enumerate(calls):
+            call_args = {key: call[key] for key in ('phase', 'status', 'bytes', 'retries', 'latency', 'request_id') if call.get(key) is not None}
+            if 'error' in call:
+                call_args['error'] = call['error']
+            event = {'name': call['endpoint'], 'cat': 'http', 'id': call_id, 'pid': pid, 'tid': call['thread']}
+            events.append(dict(event, ph='b', ts=call['start'] * 1e6, args=call_args))
+            events.append(dict(event, ph='e', ts=(call['start'] + call['total']) * 1e6))
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import logging
+
+from app.cli_parser import DETAIL_FIELDS
+
+logger = logging.getLogger('PoE_Check.results')
+
+# report status of devices that were not sent the CLI command, whose output could not be read,
+# or whose CLI batch failed so no output was collected
+UNSUPPORTED_STATUS = 'Not Supported'
+UNKNOWN_STATUS = 'Unknown'
+FAILED_STATUS = 'Failed'
+
+
+def resultRow(device, power_status, fields=None, details=False):
+    # report row for a device, with the --power_details columns when details is set
+    row = (device['hostname'], power_status)
+    if details:
+        row += tuple((fields or {}).get(field) for field, _ in DETAIL_FIELDS)
+    return row
+
+
+def assembleBatch(inventory, results, errors, details=False):
+    """Builds the report rows of one CLI batch from the (results, errors) of parseOutputs.
+
+    Returns (rows, checked, unparsed) - building -> report rows, (building, device, power_status)
+    for every device with a power status and the number of devices whose output couldn't be read,
+    which are listed as UNKNOWN_STATUS. Output for devices that aren't in the inventory is skipped.
+    """
+    rows = {}
+    checked = []
+    unparsed = 0
+    for device_id, reason in errors.items():
+        device = inventory.get(device_id)
+        if device is None:
+            logger.warning(f"Ignoring CLI output for unknown device id {device_id}")
+            continue
+        logger.warning(f"Unable to read the power status of {device.hostname} ({device_id}) - {reason}")
+        unparsed += 1
+        rows.setdefault(device.building, []).append(resultRow(device, UNKNOWN_STATUS, details=details))
+    for device_id, fields in results.items():
+        device = inventory.get(device_id)
+        if device is None:
+            logger.warning(f"Ignoring CLI output for unknown device id {device_id}")
+            continue
+        power_status = fields['status']
+        rows.setdefault(device.building, []).append(resultRow(device, power_status, fields, details))
+        checked.append((device.building, device, power_status))
+    return rows, checked, unparsed
+
+
+def failedRows(inventory, device_ids, details=False):
+    # building -> report rows listing the devices as FAILED_STATUS, for devices no CLI output was collected from
+    rows = {}
+    for device_id in device_ids:
+        device = inventory.get(device_id)
+        if device is not None:
+            rows.setdefault(device.building, []).append(resultRow(device, FAILED_STATUS, details=details))
+    return rows
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import logging
+import threading
+import time
+
+from app.json_store import loadJSON, saveJSON
+
+logger = logging.getLogger('PoE_Check.token_cache')
+
+
+class TokenCache:
+    """On-disk cache of XIQ access tokens, keyed by login and account name.
+
+    The home account of a login is stored under an empty account name. A token is only handed
+    out while it has more than refresh_margin seconds left before it expires, so a run never
+    starts with a token that is about to run out. Tokens without an expiry are kept for
+    default_ttl seconds. The file is only readable by the current user.
+    """
+    def __init__(self, path, refresh_margin=5*60, default_ttl=60*60):
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        self.entries = loadJSON(path, 'token cache')
+
+    def __save(self):
+        # only readable by the current user
+        saveJSON(self.path, self.entries, mode=0o600)
+
+    @staticmethod
+    def __key(user, account):
+        return f"{user.lower()}|{account or ''}"
+
+    def get(self, user, account=None):
+        """Returns the cached entry ({'token', 'expires', 'account_id'}) or None if there is
+        none or it expires within refresh_margin seconds."""
+        with self.lock:
+            entry = self.entries.get(self.__key(user, account))
+        if entry is None:
+            return None
+        if entry['expires'] - self.refresh_margin <= time.time():
+            logger.info(f"Cached token for {account or 'the home account'} has expired")
+            return None
+        return entry
+
+    def set(self, user, account, token, expires=None, account_id=None):
+        with self.lock:
+            self.entries[self.__key(user, account)] = {
+                'token': token,
+                'expires': expires or time.time() + self.default_ttl,
+                'account_id': account_id
+            }
+            self.__save()
+
+    def invalidate(self, user, account=None):
+        with self.lock:
+            if self.entries.pop(self.__key(user, account), None) is not None:
+                self.__save()
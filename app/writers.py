@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import csv
+import json
+import logging
+import threading
+
+logger = logging.getLogger('PoE_Check.writers')
+
+
+class ResultWriter:
+    """Writes result rows to a file as they are produced. Rows are tuples in the order of columns."""
+    extension = ''
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CSVWriter(ResultWriter):
+    extension = 'csv'
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+        self.file.flush()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLWriter(ResultWriter):
+    extension = 'jsonl'
+
+    def __init__(self, path, columns):
+        super().__init__(path, columns)
+        self.file = open(path, 'w')
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(dict(zip(self.columns, row))) + '\n' for row in rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter(ResultWriter):
+    """Buffers rows into row groups of row_group_size. Needs the optional pyarrow package.
+    The parquet footer is only written on close, so unlike CSV and JSON Lines a partly
+    written file can't be read if the process is killed."""
+    extension = 'parquet'
+
+    def __init__(self, path, columns, row_group_size=10000):
+        super().__init__(path, columns)
+        self.checkAvailable()
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.buffer = []
+
+    @staticmethod
+    def checkAvailable():
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs the pyarrow package, install it with 'pip install pyarrow'")
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.row_group_size:
+            self.__flush()
+
+    def __flush(self):
+        if self.buffer:
+            columns = list(zip(*self.buffer))
+            table = self.pa.table({name: [None if value is None else str(value) for value in values]
+                                   for name, values in zip(self.columns, columns)}, schema=self.schema)
+            self.writer.write_table(table)
+            self.buffer = []
+
+    def close(self):
+        self.__flush()
+        self.writer.close()
+
+
+WRITERS = {writer.extension: writer for writer in (CSVWriter, JSONLWriter, ParquetWriter)}
+
+
+class ResultReport:
+    """Sends results to one writer per building and output format, or to a single consolidated
+    report with a Building column. When tag_account is set results from several accounts are
+    written and tagged with the account name. Only per-status counts are kept in memory.
+
+    Rows are (device, power status) followed by a value for each of extra_columns."""
+    def __init__(self, output_dir, consolidated, formats=('csv',), tag_account=False, extra_columns=()):
+        unknown = set(formats) - set(WRITERS)
+        if unknown:
+            raise ValueError(f"Unknown output format {', '.join(sorted(unknown))}, use {', '.join(WRITERS)}")
+        for output_format in formats:
+            # fail before any checks are run if an optional writer dependency is missing
+            if hasattr(WRITERS[output_format], 'checkAvailable'):
+                WRITERS[output_format].checkAvailable()
+        self.output_dir = output_dir
+        self.consolidated = consolidated
+        self.formats = formats
+        self.tag_account = tag_account
+        self.extra_columns = list(extra_columns)
+        self.writers = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def write(self, building, rows, account=None):
+        with self.lock:
+            key = None if self.consolidated else (account, building)
+            if key not in self.writers:
+                self.writers[key] = self.__open(building, account)
+            for row in rows:
+                count_key = (account, building, row[1])
+                self.counts[count_key] = self.counts.get(count_key, 0) + 1
+            if self.consolidated:
+                tags = (account, building) if self.tag_account else (building,)
+                rows = [tags + row for row in rows]
+            for writer in self.writers[key]:
+                writer.write(rows)
+
+    def __open(self, building, account):
+        if self.consolidated:
+            name = "PoE_Check_Report"
+            columns = ['Building', 'Device', 'Power Status']
+            if self.tag_account:
+                columns.insert(0, 'Account')
+        else:
+            name = f"{account}_{building}_PoE_Check" if self.tag_account else f"{building}_PoE_Check"
+            columns = ['Device', 'Power Status']
+        columns += self.extra_columns
+        writers = []
+        for output_format in self.formats:
+            writer_class = WRITERS[output_format]
+            filename = f"{name}.{writer_class.extension}"
+            print(f"Writing {output_format.upper()} File {filename}")
+            writers.append(writer_class(f"{self.output_dir}/{filename}", columns))
+        return writers
+
+    def summary(self):
+        # {(account, building, power status): device count}
+        with self.lock:
+            return dict(self.counts)
+
+    def close(self):
+        for writers in self.writers.values():
+            for writer in writers:
+                try:
+                    writer.close()
+                except Exception as e:
+                    logger.error(f"Failed to close {writer.path}: {e}")
@@ -4,57 +4,485 @@ import os
 import inspect
 import sys
 import json
+import base64
 import time
-import requests
-import pandas as pd
+import random
+import email.utils
+import re
+import asyncio
+import threading
+import aiohttp
+import contextlib
+import functools
 from pprint import pprint as pp
 current_dir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir) 
-from requests.exceptions import HTTPError, ReadTimeout
-from app.logger import logger
+sys.path.insert(0, parent_dir)
+from app.logger import logger, request_id, newRequestId
+from app.profiler import current_phase, inPhase
 
 logger = logging.getLogger('PoE_Check.xiq_api')
 
 PATH = current_dir
 
 
-class XIQ:
-    def __init__(self, user_name=None, password=None, token=None):
-        self.URL = "https://api.extremecloudiq.com"
-        self.headers = {"Accept": "application/json", "Content-Type": "application/json"}
+# final LRO statuses without a result, any other status of an operation that isn't done is polled again
+LRO_FAILED_STATUSES = ('FAILED', 'CANCELED', 'CANCELLED')
+
+
+class XIQError(Exception):
+    """Raised by AsyncXIQ when a call fails in a way the script can't continue from.
+    The synchronous XIQ client turns it into SystemExit."""
+
+
+class XIQRateLimitError(ValueError):
+    """XIQ kept answering 429 after the scheduler's retries. The API calls don't retry it again."""
+
+
+class XIQServerError(ValueError):
+    """XIQ kept answering with a 5xx status after the scheduler's retries. The API calls don't retry it again."""
+
+
+def parseRetryAfter(value):
+    # Retry-After can be a number of seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_time.timestamp() - time.time())
+
+
+def parseRateLimitReset(value):
+    # RateLimit-Reset is a number of seconds, but X-RateLimit-Reset is often an epoch timestamp.
+    # A value too big to be a wait (past 1e9 secs, which is 2001 as an epoch) is read as a timestamp
+    if not value:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e9:
+        reset -= time.time()
+    return max(0.0, reset)
+
+
+def summarizeLRO(rawData):
+    # the done flag, metadata and error of an LRO response with a count of its device outputs, for the log.
+    # The outputs can run to megabytes, so the whole response is never formatted on the event loop
+    response = rawData.get('response')
+    outputs = response.get('device_cli_outputs') if isinstance(response, dict) else None
+    summary = {key: rawData[key] for key in ('done', 'metadata', 'error') if key in rawData}
+    if outputs is not None:
+        summary['device_cli_outputs'] = f"{len(outputs)} devices"
+    return json.dumps(summary)
+
+
+def decodeJWT(token):
+    # returns the claims of a JWT without verifying it, or an empty dict if it can't be read
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except (IndexError, ValueError):
+        return {}
+    return claims if isinstance(claims, dict) else {}
+
+
+class RequestScheduler:
+    """Central gate every XIQ request goes through.
+
+    A token bucket (rate requests per second, up to burst at once) paces all requests and each
+    endpoint has its own concurrency cap. Responses are classified so 429s, 5xx errors and
+    timeouts are retried with exponential backoff and jitter, honoring Retry-After. A 429 or an
+    exhausted RateLimit-Remaining header pauses every request until the limit resets.
+    metrics() can be read at any time while requests are running.
+    """
+    # endpoints that are expensive on the XIQ side get a lower concurrency cap
+    ENDPOINT_LIMITS = {'POST /devices/:cli': 2, 'POST /login': 1}
+
+    def __init__(self, rate=10, burst=20, default_limit=8, endpoint_limits=None, max_retries=4, backoff_base=0.5, backoff_max=60):
+        self.rate = rate
+        self.burst = burst
+        self.default_limit = default_limit
+        self.endpoint_limits = dict(self.ENDPOINT_LIMITS, **(endpoint_limits or {}))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.semaphores = {}
+        self.counts = {'queued': 0, 'in_flight': 0, 'requests': 0, 'throttled': 0, 'server_errors': 0,
+                       'timeouts': 0, 'connection_errors': 0, 'retries': 0, 'rate_limit_remaining': None}
+
+    @staticmethod
+    def endpoint(method, url):
+        # ids in the path are replaced so e.g. every LRO status poll shares one endpoint key
+        path = re.sub(r'^https?://[^/]+', '', url).split('?')[0]
+        path = re.sub(r'/\d+(?=/|$)', '/{id}', path)
+        return f"{method} {path}"
+
+    def __semaphore(self, endpoint):
+        if endpoint not in self.semaphores:
+            self.semaphores[endpoint] = asyncio.Semaphore(self.endpoint_limits.get(endpoint, self.default_limit))
+        return self.semaphores[endpoint]
+
+    async def __takeToken(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def acquire(self, endpoint):
+        self.counts['queued'] += 1
+        try:
+            await self.__semaphore(endpoint).acquire()
+            try:
+                await self.__takeToken()
+            except BaseException:
+                self.__semaphore(endpoint).release()
+                raise
+        finally:
+            self.counts['queued'] -= 1
+        self.counts['in_flight'] += 1
+        self.counts['requests'] += 1
+
+    def release(self, endpoint):
+        self.counts['in_flight'] -= 1
+        self.__semaphore(endpoint).release()
+
+    @staticmethod
+    def classify(status=None, error=None):
+        # returns why a request should be retried, or None if it shouldn't be
+        if isinstance(error, asyncio.TimeoutError):
+            return 'timeouts'
+        if error is not None:
+            return 'connection_errors'
+        if status == 429:
+            return 'throttled'
+        if status is not None and status >= 500:
+            return 'server_errors'
+        return None
+
+    def observe(self, status, headers):
+        # reads the rate limit headers XIQ returns and pauses everything when the limit is used up,
+        # for no longer than backoff_max so a bad header can't stall every request
+        remaining = headers.get('RateLimit-Remaining', headers.get('X-RateLimit-Remaining'))
+        reset = headers.get('RateLimit-Reset', headers.get('X-RateLimit-Reset'))
+        try:
+            remaining = int(remaining) if remaining is not None else None
+        except ValueError:
+            remaining = None
+        if remaining is not None:
+            self.counts['rate_limit_remaining'] = remaining
+        pause = parseRetryAfter(headers.get('Retry-After')) if status == 429 else None
+        if pause is None and (status == 429 or remaining == 0):
+            pause = parseRateLimitReset(reset)
+        if pause:
+            pause = min(pause, self.backoff_max)
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        return pause
+
+    def backoffDelay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, delay)
+
+    def record(self, reason):
+        self.counts[reason] += 1
+        self.counts['retries'] += 1
+
+    def metrics(self):
+        return dict(self.counts)
+
+
+class LROPollSchedule:
+    """Works out how long to wait between long-running operation status checks.
+
+    The first check is made quickly and the wait then backs off exponentially with jitter
+    up to max_interval. A Retry-After header or progress percentage returned by the LRO
+    takes priority over the backoff. nextDelay returns None once the deadline has passed.
+    """
+    def __init__(self, first_poll=2, max_interval=60, timeout=1800, factor=2, jitter=0.25):
+        self.first_poll = first_poll
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.start = time.monotonic()
+        self.deadline = self.start + timeout
+        self.attempt = 0
+
+    def firstDelay(self):
+        return min(self.first_poll, self.remaining())
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def nextDelay(self, retry_after=None, progress=None):
+        remaining = self.remaining()
+        if remaining <= 0:
+            return None
+        self.attempt += 1
+        delay = min(self.max_interval, self.first_poll * (self.factor ** self.attempt))
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if progress:
+            try:
+                progress = float(progress)
+            except (TypeError, ValueError):
+                progress = None
+        if retry_after is not None:
+            delay = retry_after
+        elif progress and 0 < progress < 100:
+            # estimate the time left from how far the operation has got so far
+            elapsed = time.monotonic() - self.start
+            estimate = elapsed * (100 - progress) / progress
+            delay = min(self.max_interval, max(self.first_poll, estimate))
+        return min(delay, remaining)
+
+
+def withRequestId(func):
+    # every log record written while the API call runs, including its retries, gets the same request id
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = request_id.set(newRequestId())
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            request_id.reset(token)
+    return wrapper
+
+
+class AsyncXIQ:
+    """asyncio XIQ client. Every call shares one aiohttp connection pool, so page fetches,
+    floor lookups and LRO polls from many tasks overlap on a single event loop.
+
+        async with AsyncXIQ(token=token) as x:
+            floors = await x.getFloors('Building 1')
+    """
+    def __init__(self, user_name=None, password=None, token=None, pool_size=10, connect_timeout=10, read_timeout=60, page_workers=5,
+                 lro_first_poll=2, lro_max_interval=60, lro_timeout=1800,
+                 location_cache=None, rate_limit=10, rate_burst=20, scheduler=None, base_url=None, profiler=None,
+                 token_cache=None, token_refresh_margin=5*60):
+        self.URL = (base_url or "https://api.extremecloudiq.com").rstrip('/')
+        self.headers = {"Accept": "application/json", "Content-Type": "application/json", "Connection": "keep-alive"}
         self.totalretries = 5
-        self.locationTree_df = pd.DataFrame(columns = ['id', 'name', 'type', 'parent'])
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.page_workers = page_workers
+        self.lro_first_poll = lro_first_poll
+        self.lro_max_interval = lro_max_interval
+        self.lro_timeout = lro_timeout
+        # location id -> {'name', 'type', 'parent'} of every building and floor looked up
+        self.locationTree = {}
+        self.location_cache = location_cache
+        # the scheduler can be shared by several clients on the same event loop so they are paced together
+        self.scheduler = scheduler or RequestScheduler(rate=rate_limit, burst=rate_burst)
+        # optional RunProfiler that every HTTP call is recorded to
+        self.profiler = profiler
+        # optional TokenCache, tokens from logins and account switches are saved to it and reused
+        self.token_cache = token_cache
+        # tokens are renewed this many secs before they expire when the password is known
+        self.token_refresh_margin = token_refresh_margin
+        self.session = None
+        self._request_count = 0
+        self._connection_count = 0
+        self._credentials = (user_name, password, token)
+        self._user_name = user_name
+        self._password = None
+        self._token_renew_at = None
+        # (viqID, viqName) once switched to an external account, used to renew its token
+        self._account = None
+        self._auth_lock = None
+        self._account_key_lock = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        # the session has to be created inside the running event loop
+        user_name, password, token = self._credentials
+        self._credentials = None
+        # the password is kept so the token can be renewed during a long run
+        self._password = password
+        self._auth_lock = asyncio.Lock()
+        self._account_key_lock = asyncio.Lock()
+        self.__setup_session()
+        if not token and user_name and self.token_cache is not None:
+            entry = self.token_cache.get(user_name)
+            if entry:
+                logger.info(f"Using the cached XIQ token for {user_name}")
+                token = entry['token']
         if token:
-            self.headers["Authorization"] = "Bearer " + token
+            self.__setToken(token)
+        elif not password:
+            log_msg = f"No password was given and there is no valid cached token for {user_name}"
+            logger.error(log_msg)
+            print(log_msg)
+            raise XIQError(log_msg)
         else:
             try:
-                self.__getAccessToken(user_name, password)
+                self.__setToken(await self.__getAccessToken(user_name, password))
             except ValueError as e:
                 print(e)
-                raise SystemExit
-            except HTTPError as e:
-               print(e)
-               raise SystemExit
-            except:
+                raise XIQError(e)
+            except Exception:
                 log_msg = "Unknown Error: Failed to generate token for XIQ"
                 logger.error(log_msg)
                 print(log_msg)
-                raise SystemExit 
+                raise XIQError(log_msg)
+
+    #SESSION
+    def __setup_session(self):
+        # one pooled keep-alive session is shared by every API call so TLS connections are reused
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self.__onRequestStart)
+        trace_config.on_connection_create_end.append(self.__onConnectionCreated)
+        connector = aiohttp.TCPConnector(limit=self.pool_size)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, trace_configs=[trace_config])
+
+    async def __onRequestStart(self, session, context, params):
+        self._request_count += 1
+
+    async def __onConnectionCreated(self, session, context, params):
+        self._connection_count += 1
+
+    async def __request(self, method, url, data=None, auth_headers=None):
+        # returns (status, headers, body) with the body fully read so the connection goes back to the pool
+        # 429s are retried for every call, 5xx and timeouts only for GETs so a POST is never sent twice
+        # auth_headers replaces the client's headers, e.g. to use a different token for one call
+        endpoint = self.scheduler.endpoint(method, url)
+        # calls made with the client's token renew it when it is about to expire or is rejected with a 401
+        renew_token = auth_headers is None and endpoint not in ('POST /login', 'POST /account/:switch')
+        if renew_token and self.__tokenExpiring():
+            await self.__renewToken(self.headers.get("Authorization"))
+        attempt = 0
+        renewed = False
+        call_start = time.perf_counter()
+        while True:
+            status = headers = body = error = None
+            request_headers = auth_headers or self.headers
+            token_used = request_headers.get("Authorization")
+            await self.scheduler.acquire(endpoint)
+            attempt_start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, headers=request_headers, data=data) as response:
+                    body = await response.read()
+                    status, headers = response.status, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                self.scheduler.release(endpoint)
+            if status == 401 and renew_token and not renewed:
+                renewed = True
+                if await self.__renewToken(token_used):
+                    logger.warning(f"{endpoint} was rejected with a 401, retrying with a new access token")
+                    continue
+            retry_after = self.scheduler.observe(status, headers) if headers is not None else None
+            reason = self.scheduler.classify(status, error)
+            if reason is None or (method != 'GET' and reason != 'throttled') or attempt >= self.scheduler.max_retries:
+                if self.profiler is not None:
+                    end = time.perf_counter()
+                    self.profiler.recordCall(method, endpoint, status, call_start - self.profiler.start, end - attempt_start,
+                                             end - call_start, None if body is None else len(body), attempt, error=error,
+                                             request_id=request_id.get())
+                if error is not None:
+                    raise error
+                return status, headers, body
+            attempt += 1
+            self.scheduler.record(reason)
+            delay = self.scheduler.backoffDelay(attempt, retry_after)
+            logger.warning(f"{endpoint} {reason} ({status or repr(error)}), retry {attempt} of {self.scheduler.max_retries} in {delay:.1f} secs")
+            await asyncio.sleep(delay)
+
+    #TOKENS
+    def __setToken(self, token):
+        self.headers["Authorization"] = "Bearer " + token
+        expires = decodeJWT(token).get('exp')
+        # renewed token_refresh_margin secs before it expires, or half way through its life if that is shorter
+        self._token_renew_at = None if expires is None else expires - min(self.token_refresh_margin, max(0, expires - time.time()) / 2)
+
+    def __tokenExpiring(self):
+        return self._password is not None and self._token_renew_at is not None and time.time() > self._token_renew_at
+
+    def __cacheToken(self, token, account=None, account_id=None):
+        if self.token_cache is not None and self._user_name:
+            # account ids can come from a DataFrame as numpy ints, which json can't write
+            account_id = None if account_id is None else int(account_id)
+            self.token_cache.set(self._user_name, account, token, expires=decodeJWT(token).get('exp'), account_id=account_id)
+
+    async def __renewToken(self, token_used):
+        # logs in again, and switches back to the external account if one is in use. Returns False if
+        # the token can't be renewed. Only one task renews, the others wait and then use its token
+        async with self._auth_lock:
+            if self.headers.get("Authorization") != token_used:
+                return True
+            account_name = self._account[1] if self._account else None
+            if self.token_cache is not None and self._user_name:
+                self.token_cache.invalidate(self._user_name, account_name)
+            if not self._password:
+                logger.warning("The XIQ access token was rejected or has expired and can't be renewed without a password")
+                return False
+            logger.info("Renewing the XIQ access token")
+            token = await self.__getAccessToken(self._user_name, self._password)
+            if self._account is not None:
+                token = await self.getAccountToken(*self._account, use_cache=False, home_token=token)
+            self.__setToken(token)
+            return True
+
+    def __phase(self, name):
+        # times a stage of an API workflow when a profiler is set
+        return self.profiler.phase(name) if self.profiler is not None else contextlib.nullcontext()
+
+    async def __retryPause(self, count):
+        # backoff between the attempts of the retry loops below
+        await asyncio.sleep(self.scheduler.backoffDelay(count))
+
+    def schedulerMetrics(self):
+        return self.scheduler.metrics()
+
+    def connectionStats(self):
+        return {'requests': self._request_count, 'connections': self._connection_count}
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
     #API CALLS
-    def __setup_get_api_call(self, info, url):
+    async def __setup_get_api_call(self, info, url, meta=None):
         success = 0
         for count in range(1, self.totalretries):
             try:
-                response = self.__get_api_call(url=url)
+                response = await self.__get_api_call(url=url, meta=meta)
+            except (XIQRateLimitError, XIQServerError) as e:
+                # the scheduler has already retried these with backoff, retrying them again here would only add to the load
+                print(f"API to {info} failed with {e}")
+                print('script is exiting...')
+                raise XIQError(e)
             except ValueError as e:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with {e}")
+                await self.__retryPause(count)
             except Exception as e:
                 print(f"API to {info} failed with {e}")
                 print('script is exiting...')
-                raise SystemExit
-            except:
-                print(f"API to {info} failed attempt {count} of {self.totalretries} with unknown API error")
+                raise XIQError(e)
             else:
                 success = 1
                 break
@@ -71,118 +499,123 @@ class XIQ:
                 raise Exception
         return response
 
-    def __get_api_call(self, url):
+    @withRequestId
+    async def __get_api_call(self, url, meta=None):
         try:
-            response = requests.get(url, headers= self.headers)
-        except HTTPError as http_err:
-            logger.error(f'HTTP error occurred: {http_err} - on API {url}')
-            raise ValueError(f'HTTP error occurred: {http_err}') 
-        if response is None:
-            log_msg = "ERROR: No response received from XIQ!"
-            logger.error(log_msg)
-            raise ValueError(log_msg)
-        if response.status_code != 200:
-            log_msg = f"Error - HTTP Status Code: {str(response.status_code)}"
+            status, headers, body = await self.__request('GET', url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as conn_err:
+            logger.error(f'Connection error occurred: {conn_err!r} - on API {url}')
+            raise ValueError(f'Connection error occurred: {conn_err!r}')
+        if status != 200:
+            log_msg = f"Error - HTTP Status Code: {str(status)}"
             logger.error(f"{log_msg}")
             try:
-                data = response.json()
-            except json.JSONDecodeError:
-                logger.warning(f"\t\t{response.text}")
+                data = json.loads(body)
+            except ValueError:
+                logger.warning(f"\t\t{body.decode(errors='replace')}")
             else:
                 if 'error_message' in data:
                     logger.warning(f"\t\t{data['error_message']}")
                 else:
                     logger.warning(f"\n\n{data}")
-            raise ValueError(log_msg) 
+            if status == 429:
+                raise XIQRateLimitError(log_msg)
+            if status >= 500:
+                raise XIQServerError(log_msg)
+            raise ValueError(log_msg)
+        decode_start = time.perf_counter()
         try:
-            data = response.json()
-        except json.JSONDecodeError:
-            logger.error(f"Unable to parse json data - {url} - HTTP Status Code: {str(response.status_code)}")
+            data = json.loads(body)
+        except ValueError:
+            logger.error(f"Unable to parse json data - {url} - HTTP Status Code: {str(status)}")
             raise ValueError("Unable to parse the data from json, script cannot proceed")
+        if meta is not None:
+            # callers that need more than the body (e.g. Retry-After on LRO polls) pass a dict to fill
+            meta['headers'] = headers
+            meta['bytes'] = len(body)
+            meta['decode_time'] = time.perf_counter() - decode_start
         return data
 
-    def __post_api_call(self, url, payload):
+    @withRequestId
+    async def __post_api_call(self, url, payload, auth_headers=None):
         try:
-            response = requests.post(url, headers= self.headers, data=payload)
-        except HTTPError as http_err:
-            logger.error(f'HTTP error occurred: {http_err} - on API {url}')
-            raise ValueError(f'HTTP error occurred: {http_err}') 
-        if response is None:
-            log_msg = "ERROR: No response received from XIQ!"
-            logger.error(log_msg)
-            raise ValueError(log_msg)
-        if response.status_code == 201:
+            status, headers, body = await self.__request('POST', url, data=payload, auth_headers=auth_headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as conn_err:
+            logger.error(f'Connection error occurred: {conn_err!r} - on API {url}')
+            raise ValueError(f'Connection error occurred: {conn_err!r}')
+        if status == 201:
             return "Success"
-        elif response.status_code != 200:
-            log_msg = f"Error - HTTP Status Code: {str(response.status_code)}"
+        elif status != 200:
+            log_msg = f"Error - HTTP Status Code: {str(status)}"
             logger.error(f"{log_msg}")
             try:
-                data = response.json()
-            except json.JSONDecodeError:
-                logger.warning(f"\t\t{response.text()}")
+                data = json.loads(body)
+            except ValueError:
+                logger.warning(f"\t\t{body.decode(errors='replace')}")
             else:
-                if 'error_message' in data:
+                if 'error_message' in data and status != 429:
                     logger.warning(f"\t\t{data['error_message']}")
                     raise Exception(data['error_message'])
+            if status == 429:
+                raise XIQRateLimitError(log_msg)
             raise ValueError(log_msg)
         try:
-            data = response.json()
-        except json.JSONDecodeError:
-            logger.error(f"Unable to parse json data - {url} - HTTP Status Code: {str(response.status_code)}")
+            data = json.loads(body)
+        except ValueError:
+            logger.error(f"Unable to parse json data - {url} - HTTP Status Code: {str(status)}")
             raise ValueError("Unable to parse the data from json, script cannot proceed")
         return data
 
-    
+
     ## LRO Call
-    def __post_lro_call(self, url, payload = {}, msg='', count = 1):
+    @withRequestId
+    async def __post_lro_call(self, url, payload = {}, msg='', count = 1):
         try:
-            response = requests.post(url, headers=self.headers, data=payload, timeout=60)
-        except HTTPError as http_err:
-            raise HTTPError(f'HTTP error occurred: {http_err} - on API {url}')
-        except ReadTimeout as timout_err:
-            raise HTTPError(f'HTTP error occurred: {timout_err} - on API {url}')
-        except Exception as err:
-            raise TypeError(f'Other error occurred: {err}: on API {url}')
-        else:
-            if response is None:
-                error_msg = f"Error retrieving API {msg} from XIQ - no response!"
-                raise TypeError(error_msg)
-            elif response.status_code != 202:
-                error_msg = f"Error retrieving API {msg} from XIQ - HTTP Status Code: {str(response.status_code)}"
-                print(response.text)
-                raise TypeError(error_msg) 
-            data = response.headers
-            # return the URL needed to check the status and collect data for the LRO
-            return data['Location']
-        
-    def __getAccessToken(self, user_name, password):
+            status, headers, body = await self.__request('POST', url, data=payload)
+        except asyncio.TimeoutError as timout_err:
+            raise TypeError(f'Timeout error occurred: {timout_err!r} - on API {url}')
+        except aiohttp.ClientError as err:
+            raise TypeError(f'Other error occurred: {err!r}: on API {url}')
+        if status != 202:
+            error_msg = f"Error retrieving API {msg} from XIQ - HTTP Status Code: {str(status)}"
+            print(body.decode(errors='replace'))
+            if status == 429:
+                raise XIQRateLimitError(error_msg)
+            raise TypeError(error_msg)
+        # return the URL needed to check the status and collect data for the LRO
+        return headers['Location']
+
+    async def __getAccessToken(self, user_name, password):
         info = "get XIQ token"
         success = 0
         url = self.URL + "/login"
         payload = json.dumps({"username": user_name, "password": password})
         for count in range(1, self.totalretries):
             try:
-                data = self.__post_api_call(url=url,payload=payload)
+                data = await self.__post_api_call(url=url,payload=payload)
+            except XIQRateLimitError as e:
+                print(f"API to {info} failed with {e}")
+                print('script is exiting...')
+                raise XIQError(e)
             except ValueError as e:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with {e}")
+                await self.__retryPause(count)
             except Exception as e:
                 print(f"API to {info} failed with {e}")
                 print('script is exiting...')
-                raise SystemExit
-            except:
-                print(f"API to {info} failed attempt {count} of {self.totalretries} with unknown API error")
+                raise XIQError(e)
             else:
                 success = 1
                 break
         if success != 1:
             print("failed to get XIQ token. Cannot continue to import")
             print("exiting script...")
-            raise SystemExit
-        
+            raise XIQError(f"Failed to {info}")
+
         if "access_token" in data:
             #print("Logged in and Got access token: " + data["access_token"])
-            self.headers["Authorization"] = "Bearer " + data["access_token"]
-            return 0
+            self.__cacheToken(data["access_token"])
+            return data["access_token"]
 
         else:
             log_msg = "Unknown Error: Unable to gain access token for XIQ"
@@ -191,24 +624,29 @@ class XIQ:
 
 
     # EXTERNAL ACCOUNTS
-    def __getVIQInfo(self):
+    async def __getVIQInfo(self):
         info="get current VIQ name"
         success = 0
         url = "{}/account/home".format(self.URL)
         for count in range(1, self.totalretries):
             try:
-                data = self.__get_api_call(url=url)
+                data = await self.__get_api_call(url=url)
+            except (XIQRateLimitError, XIQServerError) as e:
+                print(f"API to {info} failed with {e}")
+                break
             except ValueError as e:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with {e}")
-            except:
+                await self.__retryPause(count)
+            except Exception:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with unknown API error")
+                await self.__retryPause(count)
             else:
                 success = 1
                 break
         if success != 1:
             print(f"Failed to {info}")
             return 1
-            
+
         else:
             self.viqName = data['name']
             self.viqID = data['id']
@@ -216,75 +654,133 @@ class XIQ:
     ## EXTERNAL FUNCTION
 
     #ACCOUNT SWITCH
-    def selectManagedAccount(self):
-        self.__getVIQInfo()
+    async def selectManagedAccount(self):
+        await self.__getVIQInfo()
         info="gather accessible external XIQ acccounts"
         success = 0
         url = "{}/account/external".format(self.URL)
         for count in range(1, self.totalretries):
             try:
-                data = self.__get_api_call(url=url)
+                data = await self.__get_api_call(url=url)
+            except (XIQRateLimitError, XIQServerError) as e:
+                print(f"API to {info} failed with {e}")
+                break
             except ValueError as e:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with {e}")
-            except:
+                await self.__retryPause(count)
+            except Exception:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with unknown API error")
+                await self.__retryPause(count)
             else:
                 success = 1
                 break
         if success != 1:
             print(f"Failed to {info}")
             return 1
-            
+
         else:
             return(data, self.viqName)
-      
-    def switchAccount(self, viqID, viqName):
+
+    async def switchAccount(self, viqID, viqName):
+        if await self.switchToCachedAccount(viqName):
+            return 0
+        token = await self.getAccountToken(viqID, viqName, use_cache=False)
+        self.__setToken(token)
+        self._account = (viqID, viqName)
+        await self.__getVIQInfo()
+        if viqName != self.viqName:
+            if self.token_cache is not None and self._user_name:
+                self.token_cache.invalidate(self._user_name, viqName)
+            logger.error(f"Failed to switch external accounts. Script attempted to switch to {viqName} but is still in {self.viqName}")
+            print("Failed to switch to external account!!")
+            print("Script is exiting...")
+            raise XIQError(f"Failed to switch to external account {viqName}")
+        return 0
+
+    async def switchToCachedAccount(self, viqName):
+        # switches to the external account with a cached token, without any API calls. Returns False if there is none
+        if self.token_cache is None or not self._user_name:
+            return False
+        entry = self.token_cache.get(self._user_name, viqName)
+        if entry is None or entry.get('account_id') is None:
+            return False
+        logger.info(f"Using the cached XIQ token for {viqName}")
+        self.__setToken(entry['token'])
+        self._account = (entry['account_id'], viqName)
+        self.viqID, self.viqName = entry['account_id'], viqName
+        return True
+
+    async def getAccountToken(self, viqID, viqName, use_cache=True, home_token=None):
+        # returns an access token for the external account without switching this client to it.
+        # home_token is used to ask for it instead of the client's current token
+        if use_cache and self.token_cache is not None and self._user_name:
+            entry = self.token_cache.get(self._user_name, viqName)
+            if entry:
+                logger.info(f"Using the cached XIQ token for {viqName}")
+                return entry['token']
         info=f"switch to external account {viqName}"
         success = 0
         url = "{}/account/:switch?id={}".format(self.URL,viqID)
         payload = ''
+        auth_headers = dict(self.headers, Authorization="Bearer " + home_token) if home_token else None
         for count in range(1, self.totalretries):
             try:
-                data = self.__post_api_call(url=url, payload=payload)
+                data = await self.__post_api_call(url=url, payload=payload, auth_headers=auth_headers)
+            except XIQRateLimitError as e:
+                print(f"API to {info} failed with {e}")
+                print('script is exiting...')
+                raise XIQError(e)
             except ValueError as e:
                 print(f"API to {info} failed attempt {count} of {self.totalretries} with {e}")
+                await self.__retryPause(count)
             except Exception as e:
                 print(f"API to {info} failed with {e}")
                 print('script is exiting...')
-                raise SystemExit
-            except:
-                print(f"API to {info} failed attempt {count} of {self.totalretries} with unknown API error")
+                raise XIQError(e)
             else:
                 success = 1
                 break
         if success != 1:
             print("failed to get XIQ token to {}. Cannot continue to import".format(info))
             print("exiting script...")
-            raise SystemExit
-        
-        if "access_token" in data:
-            #print("Logged in and Got access token: " + data["access_token"])
-            self.headers["Authorization"] = "Bearer " + data["access_token"]
-            self.__getVIQInfo()
-            if viqName != self.viqName:
-                logger.error(f"Failed to switch external accounts. Script attempted to switch to {viqName} but is still in {self.viqName}")
-                print("Failed to switch to external account!!")
-                print("Script is exiting...")
-                raise SystemExit
-            return 0
+            raise XIQError(f"Failed to {info}")
 
+        if "access_token" in data:
+            self.__cacheToken(data["access_token"], viqName, viqID)
+            return data["access_token"]
         else:
             log_msg = "Unknown Error: Unable to gain access token for XIQ"
             logger.warning(log_msg)
             raise ValueError(log_msg)
 
+    def currentToken(self):
+        return self.headers.get("Authorization", "")[len("Bearer "):]
+
+    def canRenewToken(self):
+        # tokens can only be renewed when the client logged in with a password
+        return bool(self._user_name and self._password)
+
     ## LOCATIONS
-    def getFloors(self, building_name):
+    async def accountKey(self):
+        # identifies the account the current token belongs to, used to key cached data
+        claims = decodeJWT(self.currentToken())
+        if 'owner_id' in claims:
+            return str(claims['owner_id'])
+        # the floors of several buildings are looked up at once, only the first lookup asks XIQ for the account
+        async with self._account_key_lock:
+            if getattr(self, 'viqID', None) is None:
+                await self.__getVIQInfo()
+        return str(getattr(self, 'viqID', ''))
+
+    async def getFloors(self, building_name, refresh=False):
         floors = {}
         errors =[]
         info = "gathering floors"
+        cached = await self.__cachedFloors(building_name, refresh)
+        if cached is not None:
+            return cached
         url = self.URL + '/locations/building?name=' + building_name
-        rawList = self.__setup_get_api_call(info,url)
+        rawList = await self.__setup_get_api_call(info,url)
         if rawList['total_count'] == 0:
             error_msg = (f"No building was found with the name {building_name}")
             errors.append(error_msg)
@@ -302,48 +798,184 @@ class XIQ:
                 error_msg += (f"Building {rawList['data'][0]['name']} was found, please re-enter if you would like to run against this building.")
                 errors.append(error_msg)
             else:
-                floors = self._gatherFloorList(info, rawList['data'][0]['id'])
-                return floors
+                return await self.__loadFloors(rawList['data'][0], building_name)
         if errors:
             floors['errors'] = errors
         return floors
 
-    def _gatherFloorList(self, info, bld_id):
-        url = self.URL + '/locations/tree?parentId=' + str(bld_id) + '&expandChildren=false' 
-        rawList = self.__setup_get_api_call(info,url)
+    async def getBuildingFloors(self, building, name=None, refresh=False):
+        # floors of a building record from listBuildings, so it isn't looked up by name again.
+        # The floors are cached under name, the building's own name by default
+        name = name or building['name']
+        cached = await self.__cachedFloors(name, refresh, building_id=building['id'])
+        if cached is not None:
+            return cached
+        return await self.__loadFloors(building, name)
+
+    async def __cachedFloors(self, name, refresh=False, building_id=None):
+        # cached floors of the building, or None. With building_id an entry for another building of the same name is ignored
+        if self.location_cache is None:
+            return None
+        account = await self.accountKey()
+        if refresh:
+            self.location_cache.invalidate(account, name, host=self.URL)
+        entry = self.location_cache.get(account, name, host=self.URL)
+        if not entry or (building_id is not None and entry['building']['id'] != building_id):
+            return None
+        logger.info(f"Using cached floors for building {name}")
+        self.__addToLocationTree(entry['building'], entry['floors'])
+        return entry['floors']
+
+    async def __loadFloors(self, building, name):
+        floors = await self._gatherFloorList("gathering floors", building['id'])
+        self.__addToLocationTree(building, floors)
+        if self.location_cache is not None:
+            self.location_cache.set(await self.accountKey(), name, building['id'], floors, host=self.URL)
+        return floors
+
+    async def _gatherFloorList(self, info, bld_id):
+        url = self.URL + '/locations/tree?parentId=' + str(bld_id) + '&expandChildren=false'
+        rawList = await self.__setup_get_api_call(info,url)
         return rawList
 
+    def __addToLocationTree(self, building, floors):
+        # locationTree is keyed by location id so resolved buildings and floors can be looked up directly
+        self.locationTree[building['id']] = {'name': building['name'], 'type': 'BUILDING', 'parent': building.get('parent_id')}
+        for floor in floors:
+            self.locationTree[floor['id']] = {'name': floor['name'], 'type': floor.get('type', 'FLOOR'), 'parent': building['id']}
+
+    @property
+    def locationTree_df(self):
+        # pandas is only imported when the DataFrame is asked for, the client itself doesn't need it
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("locationTree_df needs the optional pandas package, install it with 'pip install -r requirements-optional.txt'") from None
+        return pd.DataFrame.from_dict(self.locationTree, orient='index', columns=['name', 'type', 'parent']).rename_axis('id')
+
     ## Devices
-    def collectDevices(self, pageSize, location_id=None):
-        info = "collecting devices" 
-        page = 1
-        pageCount = 1
-        firstCall = True
-
-        devices = []
-        while page <= pageCount:
-            url = self.URL + "/devices?views=FULL&page=" + str(page) + "&limit=" + str(pageSize) + "&connected=true"
-            if location_id:
-                url = url  + "&locationId=" +str(location_id)
-            rawList = self.__setup_get_api_call(info,url)
-            devices = devices + rawList['data']
-
-            if firstCall == True:
-                pageCount = rawList['total_pages']
-            print(f"completed page {page} of {rawList['total_pages']} collecting Devices")
-            page = rawList['page'] + 1 
-        return devices
+    async def listBuildings(self, pageSize=100):
+        info = "collecting buildings"
+        return await self.__collectPages(info, self.URL + "/locations/building?", pageSize)
 
-    def checkDevice(self, device_id):
+    async def collectDevices(self, pageSize, location_id=None, progress=None, fields=None, views='FULL', on_page=None):
+        """Collects connected devices, optionally for a single location. Passing a list of fields
+        (e.g. ['ID', 'HOSTNAME']) only requests those fields instead of the views payload.
+        With on_page each page of devices is passed to it as it arrives, in page order, and only
+        the device count is returned instead of the device list."""
+        info = "collecting devices"
+        if fields:
+            projection = "fields=" + ",".join(fields)
+        else:
+            projection = "views=" + views
+        url = self.URL + "/devices?" + projection + "&connected=true"
+        if location_id:
+            url = url  + "&locationId=" +str(location_id)
+        return await self.__collectPages(info, url + "&", pageSize, progress=progress, page_info=f"Device page ({projection})", on_page=on_page)
+
+    async def __collectPages(self, info, url, pageSize, progress=None, page_info=None, on_page=None):
+        # url must end with '?' or '&' so the page and limit parameters can be added.
+        # on_page(items) takes each page instead of them being joined into one list
+        page_slots = asyncio.Semaphore(self.page_workers)
+
+        async def fetchPage(page):
+            meta = {}
+            async with page_slots:
+                rawList = await self.__setup_get_api_call(info,url + "page=" + str(page) + "&limit=" + str(pageSize),meta=meta)
+            if page_info:
+                logger.info(f"{page_info} {page}: {meta['bytes']} bytes, json decoded in {meta['decode_time']*1000:.1f} ms")
+            return rawList
+
+        def pageDone(page, pageCount):
+            # progress callback lets callers collecting several locations at once show one combined display
+            if progress:
+                progress(page, pageCount)
+            else:
+                print(f"completed page {page} of {pageCount} {info}")
+
+        # the first page returns the page count, the remaining pages are fetched concurrently
+        rawList = await fetchPage(1)
+        pageCount = rawList['total_pages']
+        if on_page:
+            item_count = len(rawList['data'])
+            on_page(rawList['data'])
+        else:
+            items = rawList['data']
+        pageDone(1, pageCount)
+        if pageCount > 1:
+            pages = [asyncio.ensure_future(fetchPage(page)) for page in range(2, pageCount + 1)]
+            try:
+                # awaited in order, so items keep the same ordering as a serial walk
+                for page in pages:
+                    rawList = await page
+                    if on_page:
+                        item_count += len(rawList['data'])
+                        on_page(rawList['data'])
+                    else:
+                        items.extend(rawList['data'])
+                    pageDone(rawList['page'], pageCount)
+            finally:
+                for page in pages:
+                    page.cancel()
+        return item_count if on_page else items
+
+    async def checkDevice(self, device_id):
         info = "checking device status"
         url = self.URL + "/devices/" + str(device_id) + "?fields=CONNECTED"
-        rawList = self.__setup_get_api_call(info,url)
+        rawList = await self.__setup_get_api_call(info,url)
         return rawList
 
 
     ## CLI command
      ## CLI
-    def sendCLI(self, device_id_list, cmds):
+    async def sendCLI(self, device_id_list, cmds):
+        error_msg = "to send CLI command"
+        with self.__phase('cli_submit'):
+            lro_url = await self.__submitCLI(device_id_list, cmds)
+        if lro_url is None:
+            logger.error(f"API call {error_msg} failed. Script is exiting...")
+            raise XIQError(f"API call {error_msg} failed")
+        with self.__phase('cli_wait'):
+            data = await self.__waitForLRO(lro_url, len(device_id_list))
+        if data:
+            return(data)
+        else:
+            logger.warning("collecting CLI failed")
+            raise XIQError("collecting CLI failed")
+
+    async def sendCLIBatches(self, device_id_list, cmds, batch_size=500, max_in_flight=3):
+        """Sends the CLI commands in batches of batch_size devices, keeping up to max_in_flight
+        long-running operations running at once. Yields (batch_ids, data) as each batch finishes,
+        data is None if that batch failed."""
+        batches = [device_id_list[i:i + batch_size] for i in range(0, len(device_id_list), batch_size)]
+        print(f"Send CLI commands to {len(device_id_list)} devices in {len(batches)} batches of up to {batch_size} devices")
+        in_flight = asyncio.Semaphore(max(1, max_in_flight))
+
+        async def runBatch(batch_ids):
+            async with in_flight:
+                try:
+                    with self.__phase('cli_submit'):
+                        lro_url = await self.__submitCLI(batch_ids, cmds)
+                    if lro_url is None:
+                        return batch_ids, None
+                    with self.__phase('cli_wait'):
+                        return batch_ids, await self.__waitForLRO(lro_url, len(batch_ids), quiet=len(batches) > 1)
+                except Exception as e:
+                    logger.error(f"CLI batch of {len(batch_ids)} devices failed with {e}")
+                    return batch_ids, None
+
+        tasks = [asyncio.ensure_future(runBatch(batch_ids)) for batch_ids in batches]
+        try:
+            for task in asyncio.as_completed(tasks):
+                batch_ids, data = await task
+                if not data:
+                    logger.warning(f"collecting CLI failed for a batch of {len(batch_ids)} devices")
+                yield batch_ids, data
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __submitCLI(self, device_id_list, cmds):
         error_msg = "to send CLI command"
         payload = json.dumps({
             "devices": {
@@ -354,79 +986,206 @@ class XIQ:
         url = "{}/devices/:cli?async=true".format(self.URL)
         for count in range(1, self.totalretries):
             try:
-                lro_url = self.__post_lro_call(url, payload, error_msg, count=count)
+                lro_url = await self.__post_lro_call(url, payload, error_msg, count=count)
+            except XIQRateLimitError as e:
+                logger.error(f"API failed with {e}, the rate limit retries have been used up")
+                return None
             except TypeError as e:
                 logger.error(f"API failed with {e}")
-                count+=1
-                success = False
-            except HTTPError as e:
-                logger.error(f"API {e}")
-                count+=1
+                await self.__retryPause(count)
+            except Exception:
+                logger.error(f"API failed {error_msg} with an unknown API error: {url}")
+                await self.__retryPause(count)
+            else:
+                return lro_url
+        return None
+
+    async def __waitForLRO(self, lro_url, device_count, quiet=False):
+        # quiet is used when several LROs are polled at once, so their countdowns don't overwrite each other
+        schedule = LROPollSchedule(self.lro_first_poll, self.lro_max_interval, self.lro_timeout)
+        delay = schedule.firstDelay()
+        if not quiet:
+            print(f"Send CLI commands to {device_count} devices using The long-running operation. Checking status in {delay:.0f} secs.")
+        await self.__countdown(delay, quiet)
+        count = 1
+        while delay is not None:
+            if not quiet:
+                print(f"Attempting to collect CLI responses - attempt {count}")
+            retry_after = None
+            progress = None
+            meta = {}
+            try:
+                rawData = await self.__get_api_call(url=lro_url, meta=meta)
+            except (XIQRateLimitError, XIQServerError) as e:
+                logger.error(f"API failed to collect CLI responses with {e}, the scheduler retries have been used up")
+                return None
+            except (TypeError, ValueError) as e:
+                logger.error(f"API failed with {e}")
                 success = False
-            except:
-                logger.error(f"API failed {error_msg} with an unknown API error: {url}")		
-                count+=1
+            except Exception:
+                logger.error(f"API failed to collect CLI responses with an unknown API error:\n 	{lro_url}")
                 success = False
             else:
                 success = True
+            if success:
+                metadata = rawData.get('metadata') or {}
+                status = metadata.get('status')
+                if status in LRO_FAILED_STATUSES:
+                    logger.error(f"The long-running operation failed. The status is {status}")
+                    logger.warning(f"Long-running operation response: {summarizeLRO(rawData)}")
+                    return None
+                if rawData['done'] == True:
+                    return rawData['response']
+                if status != "RUNNING":
+                    logger.info(f"The long-running operation has not started yet. The status is {status}")
+                retry_after = parseRetryAfter(meta['headers'].get('Retry-After'))
+                progress = metadata.get('percentage', metadata.get('progress'))
+            delay = schedule.nextDelay(retry_after=retry_after, progress=progress)
+            if delay is None:
+                logger.error(f"The long-running operation did not complete within {self.lro_timeout} secs")
+                return None
+            if not quiet:
+                print(f"The long-running operation is not complete. Checking again in {delay:.0f} secs.")
+            await self.__countdown(delay, quiet)
+            count += 1
+        return None
+
+    async def __countdown(self, delay, quiet=False):
+        # short waits are slept quietly, longer ones show a mm:ss timer
+        if quiet or delay < 5:
+            await asyncio.sleep(delay)
+            return
+        end = time.monotonic() + delay
+        while True:
+            left = end - time.monotonic()
+            if left <= 0:
                 break
-        if success == False:
-            logger.error(f"API call {error_msg} failed. Script is exiting...")
-            raise SystemExit 
-
-        if lro_url:
-            lro_running = True
-            count = 1
-            print(f"Send CLI commands to {len(device_id_list)} devices using The long-running operation. Checking status in 60 secs.")
-            t = 60
-            while t:
-                mins, secs = divmod(t, 60)
-                timer = '{:02d}:{:02d}'.format(mins, secs)
-                print(timer, end='\r')
-                time.sleep(1)
-                t -= 1
-            while lro_running and count < 11:
-                print(f"Attempting to collect CLI responses - attempt {count} of 10")
-                try:
-                    rawData = self.__get_api_call(url=lro_url)
-                except TypeError as e:
-                    logger.error(f"API failed with {e}")
-                    count+=1
-                    success = False
-                except HTTPError as e:
-                    logger.error(f"API HTTP Error {e}")
-                    count+=1
-                    success = False
-                except:
-                    logger.error(f"API failed {error_msg} with an unknown API error:\n 	{url}")		
-                    count+=1
-                    success = False
-                else:
-                    #print("Successful Connection")
-                    success = True
-                if success:
-                    if rawData['done'] == True:
-                        data = rawData['response']
-                        lro_running = False
-                        break
-                    else:
-                        if rawData['metadata']['status'] != "RUNNING":
-                            logger.error(f"It appears that the long-running operation failed. The status is f{rawData['metadata']['status']}")
-                            logger.warning(rawData)
-                            lro_running = False
-                        else:
-                            print(f"The long-running operation is not complete. Checking again in 120 secs.")
-                            t = 120
-                            while t:
-                                mins, secs = divmod(t, 60)
-                                timer = '{:02d}:{:02d}'.format(mins, secs)
-                                print(timer, end='\r')
-                                time.sleep(1)
-                                t -= 1
-
-                count += 1
-        if data:
-            return(data)
+            mins, secs = divmod(int(left + 0.999), 60)
+            print('{:02d}:{:02d}'.format(mins, secs), end='\r')
+            await asyncio.sleep(min(1, left))
+
+
+class XIQ:
+    """Blocking XIQ client. It is a thin wrapper that runs an AsyncXIQ on a background event loop,
+    so calls made from several threads still share one connection pool and overlap on that loop.
+
+    A client created with parent (e.g. one per account in a sweep) runs on the parent's event loop
+    and shares its RequestScheduler, so the rate limit and endpoint caps cover every client together.
+    """
+    def __init__(self, user_name=None, password=None, token=None, parent=None, **settings):
+        if parent is None:
+            self.__loop = asyncio.new_event_loop()
+            self.__thread = threading.Thread(target=self.__loop.run_forever, name='xiq-event-loop', daemon=True)
+            self.__thread.start()
         else:
-            logger.warning("collecting CLI failed")
-            raise SystemExit 
\ No newline at end of file
+            self.__loop = parent.__loop
+            self.__thread = None
+            settings['scheduler'] = parent.client.scheduler
+        self.client = AsyncXIQ(user_name=user_name, password=password, token=token, **settings)
+        try:
+            self.__run(self.client.open())
+        except SystemExit:
+            self.close()
+            raise
+
+    def __run(self, coro):
+        # the calling thread's profiler phase is carried over to the event loop task
+        phase = current_phase.get()
+        if phase is not None:
+            coro = inPhase(coro, phase)
+        future = asyncio.run_coroutine_threadsafe(coro, self.__loop)
+        try:
+            return future.result()
+        except XIQError:
+            raise SystemExit
+        except BaseException:
+            # a wait interrupted by e.g. Ctrl+C cancels the call, so it isn't left running on the event loop
+            future.cancel()
+            raise
+
+    @property
+    def URL(self):
+        return self.client.URL
+
+    @URL.setter
+    def URL(self, url):
+        self.client.URL = url
+
+    @property
+    def locationTree(self):
+        return self.client.locationTree
+
+    @property
+    def locationTree_df(self):
+        return self.client.locationTree_df
+
+    def connectionStats(self):
+        return self.client.connectionStats()
+
+    def schedulerMetrics(self):
+        return self.client.schedulerMetrics()
+
+    def close(self):
+        # a client on its parent's loop only closes its session, the parent stops the loop
+        if self.__loop.is_running():
+            self.__run(self.client.close())
+            if self.__thread is not None:
+                self.__loop.call_soon_threadsafe(self.__loop.stop)
+                self.__thread.join()
+        if self.__thread is not None:
+            self.__loop.close()
+
+    def currentToken(self):
+        return self.client.currentToken()
+
+    def canRenewToken(self):
+        return self.client.canRenewToken()
+
+    def accountKey(self):
+        return self.__run(self.client.accountKey())
+
+    def selectManagedAccount(self):
+        return self.__run(self.client.selectManagedAccount())
+
+    def switchAccount(self, viqID, viqName):
+        return self.__run(self.client.switchAccount(viqID, viqName))
+
+    def getAccountToken(self, viqID, viqName):
+        return self.__run(self.client.getAccountToken(viqID, viqName))
+
+    def switchToCachedAccount(self, viqName):
+        return self.__run(self.client.switchToCachedAccount(viqName))
+
+    def getFloors(self, building_name, refresh=False):
+        return self.__run(self.client.getFloors(building_name, refresh=refresh))
+
+    def getBuildingFloors(self, building, name=None, refresh=False):
+        return self.__run(self.client.getBuildingFloors(building, name=name, refresh=refresh))
+
+    def listBuildings(self, pageSize=100):
+        return self.__run(self.client.listBuildings(pageSize))
+
+    def collectDevices(self, pageSize, location_id=None, progress=None, fields=None, views='FULL', on_page=None):
+        return self.__run(self.client.collectDevices(pageSize, location_id=location_id, progress=progress, fields=fields, views=views, on_page=on_page))
+
+    def checkDevice(self, device_id):
+        return self.__run(self.client.checkDevice(device_id))
+
+    def sendCLI(self, device_id_list, cmds):
+        return self.__run(self.client.sendCLI(device_id_list, cmds))
+
+    def sendCLIBatches(self, device_id_list, cmds, batch_size=500, max_in_flight=3):
+        batches = self.client.sendCLIBatches(device_id_list, cmds, batch_size=batch_size, max_in_flight=max_in_flight)
+
+        async def nextBatch():
+            return await batches.__anext__()
+
+        try:
+            while True:
+                try:
+                    batch = self.__run(nextBatch())
+                except StopAsyncIteration:
+                    return
+                yield batch
+        finally:
+            self.__run(batches.aclose())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""End-to-end benchmark of XIQ_PoE_Check.py against the local fake XIQ API.
+
+For each device count a fake XIQ is started in this process and the script is run in batch
+mode against it as a child process. Wall time, the number of API requests the script made
+and the peak memory of the child process are reported.
+
+    python benchmarks/bench_e2e.py --sizes 100 1000 10000 --latency 0.02
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_xiq import FakeXIQ, fakeToken
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'XIQ_PoE_Check.py')
+
+
+def runCheck(fake, extra_args):
+    with tempfile.TemporaryDirectory() as output_dir:
+        cmd = [sys.executable, SCRIPT, '--base_url', fake.url, '--token', fakeToken(1), '--all_buildings',
+               '--consolidated', '--output_dir', output_dir, '--data_dir', output_dir, '--no_history', '--no_location_cache'] + extra_args
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, cwd=output_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # wait4 gives the resource usage of this child only, ru_maxrss is in KB on linux
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        stderr = process.stderr.read().decode()
+        process.stderr.close()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise RuntimeError(f"XIQ_PoE_Check.py exited with {process.returncode}\n{stderr}")
+        with open(os.path.join(output_dir, 'PoE_Check_Report.csv')) as f:
+            rows = sum(1 for _ in f) - 1
+    return elapsed, usage.ru_maxrss / 1024, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--buildings', type=int, default=2)
+    parser.add_argument('--floors', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02, help="secs added to every fake API response")
+    parser.add_argument('--lro_duration', type=float, default=1.0)
+    parser.add_argument('--throttle_rate', type=float, default=0.0)
+    parser.add_argument('--error_rate', type=float, default=0.0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('script_args', nargs=argparse.REMAINDER, help="extra arguments passed to XIQ_PoE_Check.py after --")
+    args = parser.parse_args()
+    extra_args = [arg for arg in args.script_args if arg != '--']
+
+    print(f"{'devices':>8} {'wall s':>8} {'requests':>9} {'peak MB':>8} {'rows':>7}")
+    for size in args.sizes:
+        fake = FakeXIQ(devices=size, buildings=args.buildings, floors=args.floors, latency=args.latency,
+                       lro_duration=args.lro_duration, throttle_rate=args.throttle_rate, error_rate=args.error_rate).start()
+        try:
+            for _ in range(args.repeat):
+                fake.resetStats()
+                elapsed, peak_mb, rows = runCheck(fake, extra_args)
+                print(f"{size:>8} {elapsed:>8.2f} {fake.totalRequests():>9} {peak_mb:>8.1f} {rows:>7}")
+        finally:
+            fake.stop()
+
+
+if __name__ == '__main__':
+    main()
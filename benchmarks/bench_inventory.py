@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Memory benchmark of the device inventory in XIQ_PoE_Check.py.
+
+Compares the original representation - per floor device dict lists merged into per building
+lists, plus the id -> device and id -> building maps and the id list built for the CLI call -
+with the DeviceInventory the collectors now fill a page at a time. Pages are JSON decoded as
+they are added, like API responses, and memory is measured with tracemalloc: what the
+structure holds once collection is done and the peak while it was being built.
+
+    python benchmarks/bench_inventory.py --sizes 10000 100000 --incremental
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_xiq import FakeXIQ
+from app.inventory import DeviceInventory
+
+PAGE_SIZE = 100
+# fields requested by XIQ_PoE_Check.py, INCREMENTAL_FIELDS are only added with --incremental
+FIELDS = ['id', 'hostname', 'device_function']
+INCREMENTAL_FIELDS = ['last_connect_time', 'software_version', 'product_type']
+
+
+def makePages(count, buildings, floors, fields):
+    # (building, floor id, [encoded pages]) for every floor, the pages are decoded while measuring
+    fake = FakeXIQ(devices=count, buildings=buildings, floors=floors)
+    floor_building = {floor['id']: building['name'] for building in fake.buildings for floor in fake.floors[building['id']]}
+    floor_records = {}
+    for device in fake.devices:
+        floor_records.setdefault(device['location_id'], []).append({field: device[field] for field in fields})
+    return [(floor_building[floor_id], floor_id, [json.dumps(records[i:i + PAGE_SIZE]) for i in range(0, len(records), PAGE_SIZE)])
+            for floor_id, records in floor_records.items()]
+
+
+def listOfDicts(floor_pages):
+    floor_devices = {}
+    for building, floor_id, pages in floor_pages:
+        items = []
+        for page in pages:
+            items.extend(json.loads(page))
+        floor_devices[floor_id] = items
+    building_devices = {}
+    for building, floor_id, pages in floor_pages:
+        building_devices.setdefault(building, []).extend(floor_devices[floor_id])
+    devices = {}
+    device_building = {}
+    for building, device_data in building_devices.items():
+        for device in device_data:
+            devices[device['id']] = device
+            device_building[device['id']] = building
+    id_list = [device['id'] for device in devices.values()]
+    return building_devices, devices, device_building, id_list
+
+
+def inventory(floor_pages):
+    inventory = DeviceInventory()
+    for building, floor_id, pages in floor_pages:
+        for page in pages:
+            inventory.addPage(building, json.loads(page))
+    id_list = [device.id for chunk in inventory.chunks(500) for device in chunk]
+    return inventory, id_list
+
+
+def measure(build, floor_pages):
+    # (retained bytes, peak bytes, secs)
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(floor_pages)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--buildings', type=int, default=10)
+    parser.add_argument('--floors', type=int, default=5)
+    parser.add_argument('--incremental', action='store_true', help="include the fields collected with --incremental")
+    args = parser.parse_args()
+    fields = FIELDS + INCREMENTAL_FIELDS if args.incremental else FIELDS
+
+    print(f"{'devices':>8} {'representation':<16}{'held MB':>9}{'peak MB':>9}{'B/device':>10}{'secs':>8}")
+    for size in args.sizes:
+        floor_pages = makePages(size, args.buildings, args.floors, fields)
+        results = {}
+        for name, build in (('list of dicts', listOfDicts), ('inventory', inventory)):
+            current, peak, elapsed = measure(build, floor_pages)
+            results[name] = current
+            print(f"{size:>8} {name:<16}{current / 2**20:>9.1f}{peak / 2**20:>9.1f}{current / size:>10.0f}{elapsed:>8.2f}")
+        print(f"{size:>8} inventory holds {results['inventory'] / results['list of dicts']:.0%} of the list of dicts memory")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the CLI result assembly step of XIQ_PoE_Check.py.
+
+Times the shipped code - parseOutputs from app/cli_parser.py and assembleBatch from
+app/results.py - across a range of device counts, so a regression in either shows up
+in the scaling curve. When pandas is installed the original per-row DataFrame concat
+loop is timed as well, as the baseline the shipped code replaced.
+
+    python benchmarks/bench_result_assembly.py --sizes 250 1000 2500 5000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.cli_parser import parseOutputs
+from app.inventory import DeviceInventory
+from app.results import assembleBatch
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+def makeData(count):
+    device_data = [{'id': 1000 + i, 'hostname': f"AP-{i}", 'device_function': 'AP'} for i in range(count)]
+    cli_outputs = {str(1000 + i): [{'cli': 'show system power status', 'response_code': 'SUCCEED',
+                                     'output': f"System Power Status: {'Full' if i % 3 else 'Reduced'}\nPower Source: PoE\n"}]
+                   for i in range(count)}
+    return device_data, {'device_cli_outputs': cli_outputs}
+
+
+def concatPerRow(device_data, rawData):
+    # the result loop as it was before the columnar rewrite
+    device_df = pd.DataFrame(device_data)
+    device_df.set_index('id', inplace=True)
+    csv_df = pd.DataFrame(columns = ['Device', 'Power Status'])
+    for device_id in rawData['device_cli_outputs']:
+        output = rawData['device_cli_outputs'][device_id][0]['output']
+        regex = re.compile(r'System\sPower\sStatus:\s+(\w+)')
+        power_status = regex.findall(output)[0]
+        devicename = device_df.loc[int(device_id),'hostname']
+        temp_df = pd.DataFrame([{'Device': devicename, 'Power Status': power_status}])
+        csv_df = pd.concat([csv_df, temp_df], ignore_index=True)
+    return csv_df['Device'].tolist()
+
+
+def shipped(inventory, rawData):
+    results, errors = parseOutputs(rawData['device_cli_outputs'])
+    rows, checked, unparsed = assembleBatch(inventory, results, errors)
+    return [row[0] for building_rows in rows.values() for row in building_rows]
+
+
+def timeIt(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 1000, 2500, 5000])
+    parser.add_argument('--no_baseline', action='store_true', help="only time the shipped code, skipping the slow per-row concat loop")
+    args = parser.parse_args()
+    baseline = pd is not None and not args.no_baseline
+    if pd is None and not args.no_baseline:
+        print("pandas is not installed, only the shipped code is timed ('pip install -r requirements-optional.txt')")
+
+    print(f"{'devices':>8} {'shipped (s)':>12} {'us/device':>10}" + (f" {'per-row concat (s)':>20} {'speedup':>9}" if baseline else ''))
+    for count in args.sizes:
+        device_data, rawData = makeData(count)
+        inventory = DeviceInventory()
+        inventory.addPage('Building 1', device_data)
+        new_time, new_devices = timeIt(shipped, inventory, rawData)
+        assert len(new_devices) == count
+        line = f"{count:>8} {new_time:>12.4f} {new_time / count * 1e6:>10.1f}"
+        if baseline:
+            old_time, old_devices = timeIt(concatPerRow, device_data, rawData)
+            assert old_devices == new_devices
+            line += f" {old_time:>20.3f} {old_time / new_time:>8.0f}x"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
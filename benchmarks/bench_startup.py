@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Startup benchmark of XIQ_PoE_Check.py.
+
+Measures how long the script takes to print --help and, against the local fake XIQ API, how
+long it takes to make its first API request and to finish a small batch run. The run is
+started with -X importtime to check that modules the check doesn't need (pandas by default)
+are not imported. Exits with 1 if a forbidden module was imported or a median time is over
+its limit, so it can guard against startup regressions.
+
+    python benchmarks/bench_startup.py --repeat 5 --max_first_request 1.0
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_xiq import FakeXIQ, fakeToken
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'XIQ_PoE_Check.py')
+
+
+def timeHelp():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT, '--help'], stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def timeRun(fake):
+    # returns (secs to the first API request, secs to finish, imported module names)
+    with tempfile.TemporaryDirectory() as output_dir:
+        cmd = [sys.executable, '-X', 'importtime', SCRIPT, '--base_url', fake.url, '--token', fakeToken(1), '--all_buildings',
+               '--consolidated', '--output_dir', output_dir, '--data_dir', output_dir, '--no_history', '--no_location_cache', '--no_token_cache']
+        fake.resetStats()
+        start_time = time.time()
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=output_dir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - start
+    stderr = result.stderr.decode()
+    if result.returncode != 0:
+        raise RuntimeError(f"XIQ_PoE_Check.py exited with {result.returncode}\n{stderr[-2000:]}")
+    modules = set(re.findall(r'^import time:\s+\d+ \|\s+\d+ \|\s*([\w.]+)', stderr, re.MULTILINE))
+    return fake.first_request - start_time, elapsed, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--forbid', nargs='*', default=['pandas'], help="top level modules that must not be imported by a run")
+    parser.add_argument('--max_help', type=float, help="fail if the median --help time is over this many secs")
+    parser.add_argument('--max_first_request', type=float, help="fail if the median time to the first API request is over this many secs")
+    args = parser.parse_args()
+
+    fake = FakeXIQ(devices=args.devices, lro_duration=0).start()
+    try:
+        help_times = [timeHelp() for _ in range(args.repeat)]
+        runs = [timeRun(fake) for _ in range(args.repeat)]
+    finally:
+        fake.stop()
+    first_requests = [run[0] for run in runs]
+    totals = [run[1] for run in runs]
+    imported = set().union(*(run[2] for run in runs))
+    print(f"{'':<16}{'median s':>10}{'min s':>8}{'max s':>8}")
+    for name, values in (('--help', help_times), ('first request', first_requests), (f"{args.devices} device run", totals)):
+        print(f"{name:<16}{statistics.median(values):>10.3f}{min(values):>8.3f}{max(values):>8.3f}")
+
+    failures = []
+    for module in args.forbid:
+        if any(name == module or name.startswith(module + '.') for name in imported):
+            failures.append(f"{module} was imported")
+    if args.max_help is not None and statistics.median(help_times) > args.max_help:
+        failures.append(f"--help took longer than {args.max_help} secs")
+    if args.max_first_request is not None and statistics.median(first_requests) > args.max_first_request:
+        failures.append(f"the first API request took longer than {args.max_first_request} secs")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Local stand-in for the XIQ API, used to run and benchmark XIQ_PoE_Check.py offline.
+
+Implements /login, /account/home, /account/external, /account/:switch, /locations/building,
+/locations/tree, paginated /devices and the async /devices/:cli long-running operation flow.
+Latency, device and location counts, page size limits, LRO duration and 429/5xx error
+injection can all be tuned.
+
+    python benchmarks/fake_xiq.py --port 8080 --devices 1000 --latency 0.05
+    python XIQ_PoE_Check.py --base_url http://127.0.0.1:8080 --token fake --all_buildings
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+def fakeToken(owner_id, lifetime=24*60*60):
+    # unsigned JWT carrying the claims the script reads
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    claims = {"user_id": 1, "owner_id": owner_id, "role": "ADMINISTRATOR", "exp": int(time.time()) + lifetime}
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(claims)}.fake"
+
+
+def tokenClaims(token):
+    try:
+        payload = token.split('.')[1]
+        return json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (IndexError, ValueError):
+        return {}
+
+
+def tokenExpires(token):
+    # tokens that aren't JWTs (e.g. --token fake) never expire
+    return tokenClaims(token).get('exp', float('inf'))
+
+
+def ownerId(token):
+    return tokenClaims(token).get('owner_id', 1)
+
+
+class FakeXIQ:
+    """In-memory XIQ tenant served over HTTP. stats holds request counts per endpoint."""
+    def __init__(self, devices=1000, buildings=1, floors=5, latency=0.0, lro_duration=1.0, max_page_size=100,
+                 throttle_rate=0.0, error_rate=0.0, accounts=2, token_lifetime=24*60*60, change_rate=0.0, seed=0,
+                 lro_pending=0.0, lro_status=None):
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.lro_duration = lro_duration
+        # secs a CLI LRO reports PENDING before it starts running
+        self.lro_pending = lro_pending
+        # final status reported instead of a result once the LRO has run, e.g. FAILED
+        self.lro_status = lro_status
+        self.max_page_size = max_page_size
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.stats = {}
+        # time.time() of the first request after start or resetStats
+        self.first_request = None
+        self.accounts = [{'id': 1, 'name': 'Home Account'}] + [{'id': 100 + i, 'name': f"External {i + 1}"} for i in range(accounts)]
+        self.buildings = [{'id': 1000 + b, 'name': f"Building {b + 1}", 'parent_id': 1, 'type': 'BUILDING'} for b in range(buildings)]
+        self.floors = {building['id']: [{'id': building['id'] * 100 + f, 'name': f"Floor {f + 1}", 'parent_id': building['id'], 'type': 'FLOOR'}
+                                        for f in range(floors)]
+                       for building in self.buildings}
+        floor_ids = [floor['id'] for floor_list in self.floors.values() for floor in floor_list]
+        self.devices = [self.__device(i, floor_ids[i % len(floor_ids)]) for i in range(devices)]
+        # devices reporting reduced power, change_rate of the devices in each CLI operation flip status when it completes
+        self.reduced = {device['id'] for device in self.devices if device['id'] % 7 == 0}
+        self.change_rate = change_rate
+        self.server = None
+
+    def __device(self, i, floor_id):
+        # roughly the shape of a FULL view device record
+        switch = i % 25 == 0
+        return {
+            'id': 5000000 + i, 'hostname': f"{'SW' if switch else 'AP'}-{i:06d}", 'serial_number': f"{i:014d}",
+            'mac_address': f"{i:012X}", 'device_function': 'SWITCH' if switch else 'AP',
+            'product_type': 'SR_2208P' if switch else ('AP_4000' if i % 2 else 'AP_305C'),
+            'software_version': '10.6.1.0', 'device_admin_state': 'MANAGED', 'connected': True,
+            'last_connect_time': 1700000000000 + i, 'location_id': floor_id,
+            'network_policy_name': 'Campus', 'ip_address': f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            'description': 'Access point ' * 8, 'config_mismatch': False, 'managed_by': 'XIQ',
+            'locations': [{'id': floor_id, 'name': 'Floor'}], 'country_code': 840, 'system_up_time': 123456789
+        }
+
+    def cliOutput(self, device):
+        if device['device_function'] != 'AP':
+            return "          ^-- unknown keyword or invalid input"
+        status = 'Reduced' if device['id'] in self.reduced else 'Full'
+        return (f"System Power Status:        {status}\n"
+                f"Power Source:               PoE\n"
+                f"PoE Power Status:           802.3at\n"
+                f"Power Budget:               25.5W\n")
+
+    def start(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), self.__handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def resetStats(self):
+        with self.lock:
+            self.stats = {}
+            self.first_request = None
+
+    def totalRequests(self):
+        with self.lock:
+            return sum(self.stats.values())
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def handle_one(self, method):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                endpoint = re.sub(r'/\d+', '/{id}', url.path)
+                with fake.lock:
+                    if fake.first_request is None:
+                        fake.first_request = time.time()
+                    fake.stats[f"{method} {endpoint}"] = fake.stats.get(f"{method} {endpoint}", 0) + 1
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if fake.latency:
+                    time.sleep(fake.latency)
+                roll = fake.random.random()
+                if roll < fake.throttle_rate:
+                    return self.send(429, {'error_code': 'RATE_LIMIT', 'error_message': 'Too many requests'}, {'Retry-After': '1'})
+                if roll < fake.throttle_rate + fake.error_rate:
+                    return self.send(503, {'error_code': 'UNAVAILABLE', 'error_message': 'Service unavailable'})
+                if not url.path == '/login':
+                    authorization = self.headers.get('Authorization', '')
+                    if not authorization.startswith('Bearer '):
+                        return self.send(401, {'error_code': 'UNAUTHORIZED', 'error_message': 'Missing token'})
+                    if tokenExpires(authorization[len('Bearer '):]) < time.time():
+                        return self.send(401, {'error_code': 'UNAUTHORIZED', 'error_message': 'Token has expired'})
+                route = getattr(self, f"{method}_{url.path.strip('/').split('/')[0].replace(':', '')}", None)
+                if route is None:
+                    return self.send(404, {'error_code': 'NOT_FOUND', 'error_message': f"No route for {url.path}"})
+                return route(url.path, query, body)
+
+            def do_GET(self):
+                self.handle_one('GET')
+
+            def do_POST(self):
+                self.handle_one('POST')
+
+            def POST_login(self, path, query, body):
+                return self.send(200, {'access_token': fakeToken(1, fake.token_lifetime), 'token_type': 'Bearer', 'expires_in': fake.token_lifetime})
+
+            def GET_account(self, path, query, body):
+                if path == '/account/home':
+                    # the account the token was issued for
+                    owner_id = ownerId(self.headers['Authorization'][len('Bearer '):])
+                    return self.send(200, next((account for account in fake.accounts if account['id'] == owner_id), fake.accounts[0]))
+                if path == '/account/external':
+                    return self.send(200, fake.accounts[1:])
+                return self.send(404, {'error_message': 'not found'})
+
+            def POST_account(self, path, query, body):
+                account_id = int(query.get('id', 0))
+                if not any(account['id'] == account_id for account in fake.accounts):
+                    return self.send(400, {'error_code': 'INVALID', 'error_message': 'Unknown account'})
+                return self.send(200, {'access_token': fakeToken(account_id, fake.token_lifetime), 'token_type': 'Bearer', 'expires_in': fake.token_lifetime})
+
+            def paginate(self, items, query):
+                page = int(query.get('page', 1))
+                limit = min(int(query.get('limit', 10)), fake.max_page_size)
+                total_pages = max(1, -(-len(items) // limit))
+                data = items[(page - 1) * limit:page * limit]
+                return {'page': page, 'count': len(data), 'total_pages': total_pages, 'total_count': len(items), 'data': data}
+
+            def GET_locations(self, path, query, body):
+                if path == '/locations/building':
+                    buildings = [building for building in fake.buildings if 'name' not in query or building['name'] == query['name']]
+                    return self.send(200, self.paginate(buildings, query))
+                if path == '/locations/tree':
+                    return self.send(200, fake.floors.get(int(query.get('parentId', 0)), []))
+                return self.send(404, {'error_message': 'not found'})
+
+            def GET_devices(self, path, query, body):
+                devices = fake.devices
+                if 'locationId' in query:
+                    devices = [device for device in devices if device['location_id'] == int(query['locationId'])]
+                if 'fields' in query:
+                    fields = query['fields'].lower().split(',')
+                    devices = [{field: device[field] for field in fields if field in device} for device in devices]
+                return self.send(200, self.paginate(devices, query))
+
+            def POST_devices(self, path, query, body):
+                if path != '/devices/:cli':
+                    return self.send(404, {'error_message': 'not found'})
+                request = json.loads(body)
+                with fake.lock:
+                    operation_id = str(len(fake.operations) + 1)
+                    fake.operations[operation_id] = (time.monotonic(), request['devices']['ids'])
+                return self.send(202, {}, {'Location': f"{fake.url}/operations/{operation_id}"})
+
+            def GET_operations(self, path, query, body):
+                operation_id = path.rsplit('/', 1)[-1]
+                if operation_id not in fake.operations:
+                    return self.send(404, {'error_message': 'Unknown operation'})
+                started, ids = fake.operations[operation_id][:2]
+                elapsed = time.monotonic() - started
+                if elapsed < fake.lro_pending:
+                    return self.send(200, {'done': False, 'metadata': {'status': 'PENDING'}})
+                elapsed -= fake.lro_pending
+                if elapsed < fake.lro_duration:
+                    metadata = {'status': 'RUNNING', 'percentage': int(100 * elapsed / fake.lro_duration)}
+                    return self.send(200, {'done': False, 'metadata': metadata})
+                if fake.lro_status:
+                    return self.send(200, {'done': True, 'metadata': {'status': fake.lro_status}})
+                with fake.lock:
+                    if len(fake.operations[operation_id]) == 2 and fake.change_rate:
+                        fake.operations[operation_id] += (True,)
+                        fake.reduced ^= set(fake.random.sample(ids, int(len(ids) * fake.change_rate)))
+                devices = {device['id']: device for device in fake.devices}
+                outputs = {str(device_id): [{'cli': 'show system power status', 'response_code': 'SUCCEED',
+                                             'output': fake.cliOutput(devices[device_id])}]
+                           for device_id in ids if device_id in devices}
+                return self.send(200, {'done': True, 'metadata': {'status': 'SUCCEEDED'}, 'response': {'device_cli_outputs': outputs}})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a local fake XIQ API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--devices', type=int, default=1000)
+    parser.add_argument('--buildings', type=int, default=1)
+    parser.add_argument('--floors', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help="secs added to every response")
+    parser.add_argument('--lro_duration', type=float, default=1.0, help="secs before a CLI LRO completes")
+    parser.add_argument('--lro_pending', type=float, default=0.0, help="secs a CLI LRO is PENDING before it starts running")
+    parser.add_argument('--lro_status', help="final status CLI LROs end with instead of a result, e.g. FAILED")
+    parser.add_argument('--max_page_size', type=int, default=100)
+    parser.add_argument('--throttle_rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--accounts', type=int, default=2, help="number of external accounts")
+    parser.add_argument('--change_rate', type=float, default=0.0, help="fraction of devices whose power status flips in each CLI operation")
+    parser.add_argument('--token_lifetime', type=int, default=24*60*60, help="secs before issued tokens are rejected with a 401")
+    args = parser.parse_args()
+    fake = FakeXIQ(devices=args.devices, buildings=args.buildings, floors=args.floors, latency=args.latency,
+                   lro_duration=args.lro_duration, max_page_size=args.max_page_size, throttle_rate=args.throttle_rate,
+                   error_rate=args.error_rate, accounts=args.accounts, token_lifetime=args.token_lifetime,
+                   change_rate=args.change_rate, lro_pending=args.lro_pending, lro_status=args.lro_status)
+    fake.start(args.host, args.port)
+    print(f"Fake XIQ running at {fake.url} with {args.devices} devices. Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
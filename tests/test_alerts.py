@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from app.alerts import AlertSink, FileSink, StatusWatcher, parseSink, StdoutSink, WebhookSink
+
+
+class ListSink(AlertSink):
+    def __init__(self):
+        self.events = []
+
+    def send(self, event):
+        self.events.append(event)
+
+
+class FailingSink(AlertSink):
+    def send(self, event):
+        raise OSError("unreachable")
+
+
+def device(device_id):
+    return {'id': device_id, 'hostname': f"AP-{device_id}"}
+
+
+def test_only_changes_are_sent():
+    sink = ListSink()
+    watcher = StatusWatcher([sink])
+    watcher.observe('Building 1', device(1), 'Full')
+    watcher.observe('Building 1', device(1), 'Full')
+    assert sink.events == []
+    watcher.observe('Building 1', device(1), 'Reduced')
+    assert len(sink.events) == 1
+    event = sink.events[0]
+    assert (event['device_id'], event['hostname'], event['old_status'], event['new_status']) == (1, 'AP-1', 'Full', 'Reduced')
+    assert watcher.event_count == 1
+
+
+def test_initial_statuses_are_compared():
+    sink = ListSink()
+    watcher = StatusWatcher([sink], initial={('', 1): 'Full', ('Other', 2): 'Full'})
+    watcher.observe('Building 1', device(1), 'Reduced')
+    # the same device id in another account is a different device
+    watcher.observe('Building 1', device(2), 'Reduced')
+    assert [event['device_id'] for event in sink.events] == [1]
+
+
+def test_failing_sink_does_not_stop_the_others():
+    sink = ListSink()
+    watcher = StatusWatcher([FailingSink(), sink], initial={('', 1): 'Full'})
+    watcher.observe('Building 1', device(1), 'Reduced')
+    assert len(sink.events) == 1
+
+
+def test_forget_drops_devices_no_longer_in_the_inventory():
+    watcher = StatusWatcher([], initial={('', 1): 'Full', ('', 2): 'Full', ('Other', 3): 'Full'})
+    watcher.forget([2])
+    assert watcher.statuses == {('', 2): 'Full', ('Other', 3): 'Full'}
+
+
+def test_file_sink_writes_json_lines(tmp_path):
+    path = tmp_path / 'changes.jsonl'
+    watcher = StatusWatcher([FileSink(str(path))], initial={('', 1): 'Full'})
+    watcher.observe('Building 1', device(1), 'Reduced')
+    watcher.close()
+    assert json.loads(path.read_text())['new_status'] == 'Reduced'
+
+
+def test_parse_sink(tmp_path):
+    assert isinstance(parseSink('stdout'), StdoutSink)
+    assert isinstance(parseSink(f"file:{tmp_path / 'a.jsonl'}"), FileSink)
+    assert isinstance(parseSink('https://example.com/hook'), WebhookSink)
+    with pytest.raises(ValueError):
+        parseSink('smtp://mail')
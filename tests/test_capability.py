@@ -0,0 +1,17 @@
+from app.capability import filterSupported, unsupportedReason
+
+
+def test_only_aps_are_supported():
+    assert unsupportedReason({'device_function': 'AP', 'product_type': 'AP_4000'}) is None
+    assert unsupportedReason({'device_function': 'SWITCH', 'product_type': 'SR_2208P'}) == "device function SWITCH"
+    # devices without a device function are still sent the command
+    assert unsupportedReason({'product_type': 'AP_305C'}) is None
+    assert unsupportedReason({'device_function': None}) is None
+
+
+def test_filter_supported():
+    ap = {'id': 1, 'device_function': 'AP'}
+    switch = {'id': 2, 'device_function': 'switch'}
+    supported, skipped = filterSupported([ap, switch])
+    assert supported == [ap]
+    assert skipped == [(switch, "device function SWITCH")]
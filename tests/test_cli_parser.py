@@ -0,0 +1,52 @@
+import pytest
+
+from app.cli_parser import parseOutput, parseOutputs
+
+
+def output(text, response_code='SUCCEED'):
+    return [{'cli': 'show system power status', 'response_code': response_code, 'output': text}]
+
+
+def test_parses_status_and_fields():
+    fields = parseOutput(output("System Power Status:  Full\nPower Source: PoE\nPoE Power Status: 802.3at\n"))
+    assert fields['status'] == 'Full'
+    assert fields['power_source'] == 'PoE'
+    assert fields['poe_power_status'] == '802.3at'
+
+
+@pytest.mark.parametrize('cli_outputs', [
+    [],
+    None,
+    output(''),
+    output(None),
+    output("% Invalid input detected", response_code='FAILED'),
+    output("System Power Status:"),
+])
+def test_malformed_output_raises_value_error(cli_outputs):
+    with pytest.raises(ValueError):
+        parseOutput(cli_outputs)
+
+
+def test_bad_devices_are_errors_not_failures():
+    results, errors = parseOutputs({
+        '1': output("System Power Status: Full"),
+        '2': output("% Invalid input detected"),
+        '3': [],
+        '4': "not a list",
+        '5': [None],
+    })
+    assert set(results) == {1}
+    assert results[1]['status'] == 'Full'
+    assert set(errors) == {2, 3, 4, 5}
+    assert 'no power status' in errors[2]
+
+
+def test_invalid_device_ids_are_skipped():
+    results, errors = parseOutputs({
+        '1': output("System Power Status: Full"),
+        'abc': output("System Power Status: Full"),
+        '': output("System Power Status: Reduced"),
+        '2': output("nothing"),
+    })
+    assert set(results) == {1}
+    assert set(errors) == {2}
@@ -0,0 +1,58 @@
+import time
+
+from app.device_state import DeviceStateStore
+
+
+def device(device_id=1, **fields):
+    return dict({'id': device_id, 'hostname': f"AP-{device_id}", 'last_connect_time': 1000,
+                 'software_version': '10.6', 'product_type': 'AP_305C'}, **fields)
+
+
+def test_new_devices_are_checked(tmp_path):
+    store = DeviceStateStore(str(tmp_path / 'state.json'))
+    to_check, cached = store.split([device(1), device(2)])
+    assert [d['id'] for d in to_check] == [1, 2]
+    assert cached == []
+
+
+def test_unchanged_device_reuses_its_result(tmp_path):
+    store = DeviceStateStore(str(tmp_path / 'state.json'))
+    store.update(device(1), 'Full')
+    to_check, cached = store.split([device(1), device(2)])
+    assert [d['id'] for d in to_check] == [2]
+    assert [(d['id'], status) for d, status in cached] == [(1, 'Full')]
+
+
+def test_changed_fingerprint_is_checked_again(tmp_path):
+    store = DeviceStateStore(str(tmp_path / 'state.json'))
+    for d in (device(1), device(2), device(3)):
+        store.update(d, 'Full')
+    to_check, cached = store.split([device(1, last_connect_time=2000), device(2, software_version='10.7'), device(3)])
+    assert [d['id'] for d in to_check] == [1, 2]
+    assert [d['id'] for d, _ in cached] == [3]
+
+
+def test_results_older_than_max_age_are_checked_again(tmp_path):
+    store = DeviceStateStore(str(tmp_path / 'state.json'), max_age=60)
+    store.update(device(1), 'Full')
+    store.update(device(2), 'Full')
+    store.devices['1']['checked'] = time.time() - 61
+    to_check, cached = store.split([device(1), device(2)])
+    assert [d['id'] for d in to_check] == [1]
+    assert [d['id'] for d, _ in cached] == [2]
+
+
+def test_state_is_saved(tmp_path):
+    path = str(tmp_path / 'cache' / 'state.json')
+    store = DeviceStateStore(path)
+    store.update(device(1), 'Reduced')
+    store.save()
+    _, cached = DeviceStateStore(path).split([device(1)])
+    assert [(d['id'], status) for d, status in cached] == [(1, 'Reduced')]
+
+
+def test_unreadable_file_is_ignored(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('{not json')
+    to_check, _ = DeviceStateStore(str(path)).split([device(1)])
+    assert len(to_check) == 1
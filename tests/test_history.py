@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+from app.history import PoEHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = PoEHistory(str(tmp_path / 'history.db'))
+    yield history
+    history.close()
+
+
+def test_only_status_changes_are_recorded_as_changes(history):
+    history.record('Building 1', [(1, 'AP-1', 'Full'), (2, 'AP-2', 'Full')])
+    assert history.changes(1) == []
+    history.record('Building 1', [(1, 'AP-1', 'Reduced'), (2, 'AP-2', 'Full')])
+    history.record('Building 1', [(1, 'AP-1', 'Reduced')])
+    changes = history.changes(1)
+    assert [change[1:] for change in changes] == [('', 'Building 1', 1, 'AP-1', 'Full', 'Reduced')]
+
+
+def test_changes_are_compared_per_account_and_building(history):
+    history.record('Building 1', [(1, 'AP-1', 'Full')], account='A')
+    history.record('Building 1', [(1, 'AP-1', 'Reduced')], account='B')
+    history.record('Building 2', [(1, 'AP-1', 'Reduced')], account='A')
+    assert history.changes(1) == []
+    history.record('Building 1', [(1, 'AP-1', 'Reduced')], account='A')
+    assert [change[1:3] for change in history.changes(1)] == [('A', 'Building 1')]
+
+
+def test_changes_window_and_building_filter(history):
+    now = time.time()
+    history.record('Building 1', [(1, 'AP-1', 'Full')], ts=now - 10 * 86400)
+    history.record('Building 1', [(1, 'AP-1', 'Reduced')], ts=now - 5 * 86400)
+    history.record('Building 2', [(2, 'AP-2', 'Full')], ts=now - 5 * 86400)
+    history.record('Building 2', [(2, 'AP-2', 'Reduced')], ts=now - 3600)
+    history.record('Building 1', [(1, 'AP-1', 'Full')], ts=now - 60)
+    # ordered by time, only changes inside the window
+    assert [(change[2], change[6]) for change in history.changes(1)] == [('Building 2', 'Reduced'), ('Building 1', 'Full')]
+    assert len(history.changes(7)) == 3
+    assert [change[6] for change in history.changes(7, buildings=['Building 1'])] == ['Reduced', 'Full']
+
+
+def test_results_are_kept_between_runs(tmp_path):
+    path = str(tmp_path / 'history.db')
+    history = PoEHistory(path)
+    history.record('Building 1', [(1, 'AP-1', 'Full')])
+    history.close()
+    history = PoEHistory(path)
+    history.record('Building 1', [(1, 'AP-1', 'Reduced')])
+    assert len(history.changes(1)) == 1
+    history.close()
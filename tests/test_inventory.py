@@ -0,0 +1,54 @@
+import pytest
+
+from app.inventory import DeviceInventory
+
+
+def records(*ids, **fields):
+    return [dict({'id': device_id, 'hostname': f"AP-{device_id}"}, **fields) for device_id in ids]
+
+
+def test_devices_are_kept_in_order_with_their_building():
+    inventory = DeviceInventory()
+    assert inventory.addPage('Building 1', records(1, 2)) == 2
+    inventory.addPage('Building 2', records(3))
+    assert [device.id for device in inventory] == [1, 2, 3]
+    assert inventory.get(3).building == 'Building 2'
+    assert inventory.byHostname('AP-2').id == 2
+    assert inventory.buildingCounts() == {'Building 1': 2, 'Building 2': 1}
+    assert 1 in inventory and 4 not in inventory
+    assert len(inventory) == 3
+
+
+def test_duplicate_id_replaces_the_earlier_record():
+    inventory = DeviceInventory()
+    inventory.addPage('Building 1', records(1, 2))
+    inventory.addPage('Building 2', [{'id': 1, 'hostname': 'AP-1-renamed'}])
+    assert len(inventory) == 2
+    assert inventory.get(1).hostname == 'AP-1-renamed'
+    assert inventory.get(1).building == 'Building 2'
+    assert inventory.byHostname('AP-1') is None
+    assert inventory.buildingCounts() == {'Building 1': 1, 'Building 2': 1}
+    # a building left without devices is dropped from the counts
+    inventory.addPage('Building 2', records(2))
+    assert inventory.buildingCounts() == {'Building 2': 2}
+
+
+def test_chunks():
+    inventory = DeviceInventory()
+    inventory.addPage('Building 1', records(*range(7)))
+    assert [[device.id for device in chunk] for chunk in inventory.chunks(3)] == [[0, 1, 2], [3, 4, 5], [6]]
+    assert [len(chunk) for chunk in inventory.chunks(7)] == [7]
+    assert list(DeviceInventory().chunks(3)) == []
+
+
+def test_device_reads_like_the_api_record():
+    inventory = DeviceInventory()
+    inventory.addPage('Building 1', records(1, device_function='AP', location_id=5))
+    device = inventory.get(1)
+    assert device['hostname'] == 'AP-1'
+    assert device.get('device_function') == 'AP'
+    # fields the API didn't return, or that aren't kept, read as missing
+    assert device.get('product_type', 'none') == 'none'
+    assert device.get('location_id') is None
+    with pytest.raises(KeyError):
+        device['software_version']
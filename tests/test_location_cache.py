@@ -0,0 +1,54 @@
+from app.location_cache import LocationCache
+
+FLOORS = [{'id': 11, 'name': 'Floor 1'}]
+
+
+def test_entries_are_keyed_by_account_and_building(tmp_path):
+    cache = LocationCache(str(tmp_path / 'locations.json'))
+    cache.set('1', 'Building 1', 10, FLOORS)
+    assert cache.get('1', 'Building 1')['floors'] == FLOORS
+    assert cache.get('1', 'Building 1')['building'] == {'id': 10, 'name': 'Building 1'}
+    assert cache.get('2', 'Building 1') is None
+    assert cache.get('1', 'Building 2') is None
+
+
+def test_entries_are_saved(tmp_path):
+    path = str(tmp_path / 'cache' / 'locations.json')
+    LocationCache(path).set('1', 'Building 1', 10, FLOORS)
+    assert LocationCache(path).get('1', 'Building 1')['floors'] == FLOORS
+
+
+def test_expired_entries_are_missing(tmp_path):
+    cache = LocationCache(str(tmp_path / 'locations.json'), ttl=60)
+    cache.set('1', 'Building 1', 10, FLOORS)
+    cache.entries['|1|Building 1']['timestamp'] -= 61
+    assert cache.get('1', 'Building 1') is None
+
+
+def test_invalidate(tmp_path):
+    cache = LocationCache(str(tmp_path / 'locations.json'))
+    cache.set('1', 'Building 1', 10, FLOORS)
+    cache.set('1', 'Building 2', 20, FLOORS)
+    cache.set('2', 'Building 1', 30, FLOORS)
+    cache.invalidate('1', 'Building 1')
+    assert cache.get('1', 'Building 1') is None
+    assert cache.get('1', 'Building 2') is not None
+    cache.invalidate(account='2')
+    assert cache.get('2', 'Building 1') is None
+    cache.invalidate()
+    assert cache.entries == {}
+
+
+def test_entries_are_kept_per_api_host(tmp_path):
+    cache = LocationCache(str(tmp_path / 'locations.json'))
+    cache.set('1', 'Building 1', 10, FLOORS, host='http://host-a')
+    assert cache.get('1', 'Building 1', host='http://host-b') is None
+    assert cache.get('1', 'Building 1', host='http://host-a')['building']['id'] == 10
+    cache.invalidate(host='http://host-b')
+    assert cache.get('1', 'Building 1', host='http://host-a') is not None
+
+
+def test_entries_without_a_host_are_dropped(tmp_path):
+    path = tmp_path / 'locations.json'
+    path.write_text('{"1|Building 1": {"timestamp": 0, "building": {"id": 10, "name": "Building 1"}, "floors": []}}')
+    assert LocationCache(str(path)).entries == {}
@@ -0,0 +1,50 @@
+import json
+import logging
+
+import pytest
+
+from app import logger as app_logger
+
+log = logging.getLogger('PoE_Check.test')
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    app_logger.stopLogging()
+    yield tmp_path / 'PoE_log.log'
+    app_logger.stopLogging()
+
+
+def logException():
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        log.exception("Checking failed")
+
+
+def test_json_log_has_the_exception(log_file):
+    app_logger.setupLogging(str(log_file), json_format=True)
+    logException()
+    app_logger.stopLogging()
+    record = json.loads(log_file.read_text())
+    assert record['message'] == "Checking failed"
+    assert record['level'] == 'ERROR'
+    assert 'ZeroDivisionError' in record['exception']
+
+
+def test_text_log_has_the_traceback_after_the_message(log_file):
+    app_logger.setupLogging(str(log_file))
+    logException()
+    app_logger.stopLogging()
+    text = log_file.read_text()
+    assert "PoE_Check.test - ERROR - Checking failed\nTraceback" in text
+    assert 'ZeroDivisionError' in text
+
+
+def test_long_messages_are_cut_short(log_file):
+    app_logger.setupLogging(str(log_file), json_format=True)
+    log.warning("x" * (app_logger.maxMessageSize + 10))
+    app_logger.stopLogging()
+    message = json.loads(log_file.read_text())['message']
+    assert message.startswith("x" * app_logger.maxMessageSize + "...")
+    assert "10 more characters not logged" in message
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app.xiq_api import AsyncXIQ, XIQError, summarizeLRO
+from fake_xiq import FakeXIQ, fakeToken
+
+CMDS = ['show system power status']
+
+
+@pytest.fixture
+def fake():
+    servers = []
+
+    def start(**kwargs):
+        server = FakeXIQ(devices=10, lro_duration=0, **kwargs).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.stop()
+
+
+async def sendCLI(server):
+    async with AsyncXIQ(token=fakeToken(1), base_url=server.url, lro_first_poll=0.05, lro_max_interval=0.1, lro_timeout=10) as x:
+        device_ids = [device['id'] for device in server.devices]
+        return device_ids, await x.sendCLI(device_ids, CMDS)
+
+
+def test_pending_operation_is_polled_until_it_completes(fake):
+    server = fake(lro_pending=0.3)
+    device_ids, data = asyncio.run(sendCLI(server))
+    assert sorted(data['device_cli_outputs']) == sorted(str(device_id) for device_id in device_ids)
+    # the PENDING answers were polled again rather than treated as a failure
+    assert server.stats['GET /operations/{id}'] >= 2
+
+
+def test_failed_operation_is_not_polled_again(fake):
+    server = fake(lro_status='FAILED')
+    with pytest.raises(XIQError):
+        asyncio.run(sendCLI(server))
+    assert server.stats['GET /operations/{id}'] == 1
+
+
+def test_lro_summary_leaves_out_the_device_outputs():
+    outputs = {str(device_id): [{'output': 'x' * 1000}] for device_id in range(1000)}
+    summary = summarizeLRO({'done': True, 'metadata': {'status': 'FAILED'}, 'response': {'device_cli_outputs': outputs}})
+    assert summary == '{"done": true, "metadata": {"status": "FAILED"}, "device_cli_outputs": "1000 devices"}'
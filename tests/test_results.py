@@ -0,0 +1,38 @@
+from app.cli_parser import parseOutputs
+from app.inventory import DeviceInventory
+from app.results import FAILED_STATUS, UNKNOWN_STATUS, assembleBatch, failedRows, resultRow
+
+
+def inventory():
+    inventory = DeviceInventory()
+    inventory.addPage('Building 1', [{'id': 1, 'hostname': 'AP-1'}, {'id': 2, 'hostname': 'AP-2'}])
+    inventory.addPage('Building 2', [{'id': 3, 'hostname': 'AP-3'}])
+    return inventory
+
+
+def output(text):
+    return [{'cli': 'show system power status', 'response_code': 'SUCCEED', 'output': text}]
+
+
+def test_rows_are_split_by_building():
+    results, errors = parseOutputs({
+        '1': output("System Power Status: Full\nPower Source: PoE"),
+        '2': output("% Invalid input"),
+        '3': output("System Power Status: Reduced"),
+        '4': output("System Power Status: Full"),
+    })
+    rows, checked, unparsed = assembleBatch(inventory(), results, errors)
+    assert rows == {'Building 1': [('AP-2', UNKNOWN_STATUS), ('AP-1', 'Full')], 'Building 2': [('AP-3', 'Reduced')]}
+    assert [(building, device.id, status) for building, device, status in checked] == [('Building 1', 1, 'Full'), ('Building 2', 3, 'Reduced')]
+    assert unparsed == 1
+
+
+def test_detail_columns():
+    device = {'hostname': 'AP-1'}
+    assert resultRow(device, 'Full', {'power_source': 'PoE'}, details=True) == ('AP-1', 'Full', 'PoE', None, None)
+    assert resultRow(device, 'Full', {'power_source': 'PoE'}) == ('AP-1', 'Full')
+
+
+def test_failed_devices_are_listed_per_building():
+    rows = failedRows(inventory(), [3, 1, 99])
+    assert rows == {'Building 2': [('AP-3', FAILED_STATUS)], 'Building 1': [('AP-1', FAILED_STATUS)]}
@@ -0,0 +1,170 @@
+import asyncio
+import email.utils
+import time
+
+import aiohttp
+import pytest
+
+from app.xiq_api import AsyncXIQ, LROPollSchedule, RequestScheduler, XIQError, parseRateLimitReset, parseRetryAfter
+from fake_xiq import FakeXIQ, fakeToken
+
+
+@pytest.fixture
+def fake():
+    servers = []
+
+    def start(**kwargs):
+        server = FakeXIQ(devices=10, lro_duration=0, **kwargs).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.stop()
+
+
+async def listBuildings(server, scheduler):
+    async with AsyncXIQ(token=fakeToken(1), base_url=server.url, scheduler=scheduler) as x:
+        return await x.listBuildings()
+
+
+def test_classify():
+    assert RequestScheduler.classify(429) == 'throttled'
+    assert RequestScheduler.classify(503) == 'server_errors'
+    assert RequestScheduler.classify(error=asyncio.TimeoutError()) == 'timeouts'
+    assert RequestScheduler.classify(error=aiohttp.ClientConnectionError()) == 'connection_errors'
+    assert RequestScheduler.classify(200) is None
+    assert RequestScheduler.classify(404) is None
+
+
+def test_endpoint_replaces_ids():
+    assert RequestScheduler.endpoint('GET', 'https://x/operations/123?a=1') == 'GET /operations/{id}'
+
+
+def test_parse_retry_after():
+    assert parseRetryAfter('3') == 3.0
+    assert parseRetryAfter('-1') == 0.0
+    assert parseRetryAfter(None) is None
+    assert parseRetryAfter('soon') is None
+    retry_date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < parseRetryAfter(retry_date) <= 30
+
+
+def test_retry_after_pauses_requests():
+    scheduler = RequestScheduler()
+    assert scheduler.observe(429, {'Retry-After': '2'}) == 2.0
+    assert scheduler.paused_until - time.monotonic() == pytest.approx(2.0, abs=0.1)
+    # Retry-After is only used for 429s
+    scheduler = RequestScheduler()
+    assert scheduler.observe(200, {'Retry-After': '2'}) is None
+    assert scheduler.paused_until == 0.0
+
+
+def test_exhausted_rate_limit_pauses_until_reset():
+    scheduler = RequestScheduler()
+    assert scheduler.observe(200, {'RateLimit-Remaining': '0', 'RateLimit-Reset': '5'}) == 5.0
+    assert scheduler.metrics()['rate_limit_remaining'] == 0
+
+
+def test_parse_rate_limit_reset():
+    assert parseRateLimitReset('5') == 5.0
+    assert parseRateLimitReset(None) is None
+    assert parseRateLimitReset('soon') is None
+    # an epoch timestamp is turned into the secs until then
+    assert 25 < parseRateLimitReset(str(int(time.time()) + 30)) <= 30
+    assert parseRateLimitReset(str(int(time.time()) - 30)) == 0.0
+
+
+def test_epoch_rate_limit_reset_pauses_until_then():
+    scheduler = RequestScheduler()
+    reset = str(int(time.time()) + 10)
+    assert 8 < scheduler.observe(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': reset}) <= 10
+
+
+def test_pauses_from_headers_are_capped():
+    scheduler = RequestScheduler(backoff_max=30)
+    assert scheduler.observe(429, {'Retry-After': '600'}) == 30
+    assert scheduler.observe(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 3600)}) == 30
+    assert scheduler.paused_until - time.monotonic() <= 30
+
+
+def test_backoff_delay():
+    scheduler = RequestScheduler(backoff_base=1, backoff_max=4)
+    assert scheduler.backoffDelay(3, retry_after=7) == 7
+    for attempt in range(1, 8):
+        assert 0 <= scheduler.backoffDelay(attempt) <= min(4, 2 ** (attempt - 1))
+
+
+def test_token_bucket_paces_requests():
+    scheduler = RequestScheduler(rate=20, burst=2)
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(4):
+            await scheduler.acquire('GET /x')
+            scheduler.release('GET /x')
+        return time.monotonic() - start
+    # the burst of 2 goes at once, the other 2 wait for tokens at 20 a second
+    assert asyncio.run(run()) >= 0.09
+    assert scheduler.metrics()['requests'] == 4
+
+
+def test_429_is_retried_after_retry_after(fake):
+    server = fake(throttle_rate=0.5, seed=3)
+    scheduler = RequestScheduler(max_retries=6)
+    start = time.monotonic()
+    buildings = asyncio.run(listBuildings(server, scheduler))
+    metrics = scheduler.metrics()
+    assert [building['name'] for building in buildings] == ['Building 1']
+    assert metrics['throttled'] >= 1
+    # the fake answers 429s with Retry-After: 1
+    assert time.monotonic() - start >= metrics['throttled']
+
+
+def test_server_errors_are_retried_with_backoff(fake):
+    server = fake(error_rate=0.5, seed=1)
+    scheduler = RequestScheduler(max_retries=6, backoff_base=0.01)
+    buildings = asyncio.run(listBuildings(server, scheduler))
+    assert len(buildings) == 1
+    assert scheduler.metrics()['server_errors'] >= 1
+    assert scheduler.metrics()['retries'] == scheduler.metrics()['server_errors']
+
+
+def test_exhausted_retries_are_not_retried_again(fake):
+    server = fake(error_rate=1.0)
+    scheduler = RequestScheduler(max_retries=2, backoff_base=0.01)
+    with pytest.raises(XIQError):
+        asyncio.run(listBuildings(server, scheduler))
+    # the first attempt and the scheduler's 2 retries, with no second round from the API call's own retry loop
+    assert server.totalRequests() == 3
+
+
+def test_lro_first_delay_is_capped_by_the_deadline():
+    assert LROPollSchedule(first_poll=2, timeout=60).firstDelay() == 2
+    assert LROPollSchedule(first_poll=2, timeout=0.5).firstDelay() <= 0.5
+
+
+def test_lro_gives_up_after_the_deadline():
+    schedule = LROPollSchedule(first_poll=0.01, timeout=0.05)
+    time.sleep(0.06)
+    assert schedule.nextDelay() is None
+
+
+def test_lro_delay_never_passes_the_deadline():
+    schedule = LROPollSchedule(first_poll=2, max_interval=60, timeout=5)
+    assert schedule.nextDelay() <= 5
+    assert schedule.nextDelay(retry_after=30) <= 5
+
+
+def test_lro_backoff_is_capped():
+    schedule = LROPollSchedule(first_poll=1, max_interval=10, timeout=3600, jitter=0)
+    delays = [schedule.nextDelay() for _ in range(6)]
+    assert delays == [2, 4, 8, 10, 10, 10]
+
+
+def test_lro_retry_after_and_progress():
+    schedule = LROPollSchedule(first_poll=1, max_interval=60, timeout=3600, jitter=0)
+    assert schedule.nextDelay(retry_after=7) == 7
+    schedule.start -= 10
+    # 10 secs for the first 50% estimates another 10 secs
+    assert schedule.nextDelay(progress=50) == pytest.approx(10, abs=0.1)
+    assert schedule.nextDelay(progress='not a number') == 8
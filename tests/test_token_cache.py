@@ -0,0 +1,59 @@
+import os
+import stat
+import time
+
+import pytest
+
+from app.token_cache import TokenCache
+
+
+def test_valid_token_is_reused(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    TokenCache(path).set('User@Example.com', None, 'abc', expires=time.time() + 3600, account_id=1)
+    entry = TokenCache(path).get('user@example.com')
+    assert entry['token'] == 'abc'
+    assert entry['account_id'] == 1
+
+
+def test_tokens_are_kept_per_account(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens.json'))
+    cache.set('user', None, 'home', expires=time.time() + 3600)
+    cache.set('user', 'External 1', 'external', expires=time.time() + 3600)
+    assert cache.get('user')['token'] == 'home'
+    assert cache.get('user', 'External 1')['token'] == 'external'
+    assert cache.get('user', 'External 2') is None
+
+
+def test_token_expiring_within_the_margin_is_not_used(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens.json'), refresh_margin=300)
+    cache.set('user', None, 'old', expires=time.time() + 200)
+    assert cache.get('user') is None
+    cache.set('user', None, 'expired', expires=time.time() - 10)
+    assert cache.get('user') is None
+
+
+def test_token_without_expiry_uses_the_default_ttl(tmp_path):
+    cache = TokenCache(str(tmp_path / 'tokens.json'), refresh_margin=0, default_ttl=100)
+    cache.set('user', None, 'abc')
+    assert cache.get('user')['expires'] - time.time() == pytest.approx(100, abs=1)
+
+
+def test_invalidate(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    cache = TokenCache(path)
+    cache.set('user', None, 'abc', expires=time.time() + 3600)
+    cache.invalidate('user')
+    assert cache.get('user') is None
+    assert TokenCache(path).get('user') is None
+
+
+def test_file_is_only_readable_by_the_user(tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    TokenCache(path).set('user', None, 'abc', expires=time.time() + 3600)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_unreadable_file_is_ignored(tmp_path):
+    path = tmp_path / 'tokens.json'
+    path.write_text('{not json')
+    assert TokenCache(str(path)).get('user') is None
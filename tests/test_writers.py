@@ -0,0 +1,72 @@
+import csv
+import json
+
+import pytest
+
+from app.writers import ResultReport
+
+
+def readCSV(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_one_file_per_building(tmp_path):
+    report = ResultReport(str(tmp_path), consolidated=False)
+    report.write('Building 1', [('AP-1', 'Full')])
+    report.write('Building 2', [('AP-2', 'Reduced')])
+    report.write('Building 1', [('AP-3', 'Full')])
+    report.close()
+    assert readCSV(tmp_path / 'Building 1_PoE_Check.csv') == [['Device', 'Power Status'], ['AP-1', 'Full'], ['AP-3', 'Full']]
+    assert readCSV(tmp_path / 'Building 2_PoE_Check.csv') == [['Device', 'Power Status'], ['AP-2', 'Reduced']]
+
+
+def test_consolidated_report_has_a_building_column(tmp_path):
+    report = ResultReport(str(tmp_path), consolidated=True, extra_columns=['Power Source'])
+    report.write('Building 1', [('AP-1', 'Full', 'PoE')])
+    report.write('Building 2', [('AP-2', 'Reduced', None)])
+    report.close()
+    assert readCSV(tmp_path / 'PoE_Check_Report.csv') == [['Building', 'Device', 'Power Status', 'Power Source'],
+                                                          ['Building 1', 'AP-1', 'Full', 'PoE'],
+                                                          ['Building 2', 'AP-2', 'Reduced', '']]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['PoE_Check_Report.csv']
+
+
+def test_tag_account(tmp_path):
+    report = ResultReport(str(tmp_path), consolidated=True, tag_account=True)
+    report.write('Building 1', [('AP-1', 'Full')], account='A')
+    report.write('Building 1', [('AP-1', 'Reduced')], account='B')
+    report.close()
+    assert readCSV(tmp_path / 'PoE_Check_Report.csv') == [['Account', 'Building', 'Device', 'Power Status'],
+                                                          ['A', 'Building 1', 'AP-1', 'Full'],
+                                                          ['B', 'Building 1', 'AP-1', 'Reduced']]
+    # per building files of several accounts are kept apart by the account name
+    (tmp_path / 'split').mkdir()
+    report = ResultReport(str(tmp_path / 'split'), consolidated=False, tag_account=True)
+    report.write('Building 1', [('AP-1', 'Full')], account='A')
+    report.write('Building 1', [('AP-1', 'Reduced')], account='B')
+    report.close()
+    assert sorted(path.name for path in (tmp_path / 'split').iterdir()) == ['A_Building 1_PoE_Check.csv', 'B_Building 1_PoE_Check.csv']
+
+
+def test_jsonl_rows_are_keyed_by_column(tmp_path):
+    report = ResultReport(str(tmp_path), consolidated=True, formats=['csv', 'jsonl'])
+    report.write('Building 1', [('AP-1', 'Full')])
+    report.close()
+    with open(tmp_path / 'PoE_Check_Report.jsonl') as f:
+        assert [json.loads(line) for line in f] == [{'Building': 'Building 1', 'Device': 'AP-1', 'Power Status': 'Full'}]
+    assert len(readCSV(tmp_path / 'PoE_Check_Report.csv')) == 2
+
+
+def test_summary_counts_statuses(tmp_path):
+    report = ResultReport(str(tmp_path), consolidated=True, tag_account=True)
+    report.write('Building 1', [('AP-1', 'Full'), ('AP-2', 'Full'), ('AP-3', 'Reduced')], account='A')
+    report.write('Building 1', [('AP-4', 'Full')], account='B')
+    report.close()
+    assert report.summary() == {('A', 'Building 1', 'Full'): 2, ('A', 'Building 1', 'Reduced'): 1, ('B', 'Building 1', 'Full'): 1}
+
+
+def test_unknown_format_is_rejected_before_anything_is_written(tmp_path):
+    with pytest.raises(ValueError):
+        ResultReport(str(tmp_path), consolidated=True, formats=['csv', 'xlsx'])
+    assert list(tmp_path.iterdir()) == []
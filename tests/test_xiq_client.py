@@ -0,0 +1,82 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.location_cache import LocationCache
+from app.xiq_api import XIQ
+from fake_xiq import FakeXIQ, fakeToken
+
+
+@pytest.fixture
+def server():
+    server = FakeXIQ(devices=10, accounts=1, lro_duration=0).start()
+    yield server
+    server.stop()
+
+
+def test_account_clients_share_the_parents_scheduler(server):
+    x = XIQ(token=fakeToken(1), base_url=server.url)
+    try:
+        account_x = XIQ(token=fakeToken(100), base_url=server.url, parent=x)
+        assert account_x.client.scheduler is x.client.scheduler
+        assert len(account_x.listBuildings()) == 1
+        account_x.close()
+        # closing an account client leaves the parent's event loop running
+        assert len(x.listBuildings()) == 1
+        assert x.schedulerMetrics()['requests'] == 2
+    finally:
+        x.close()
+
+
+def test_account_is_looked_up_once_for_concurrent_floor_lookups(server, tmp_path):
+    # a token without an owner_id claim, so the account has to be asked for
+    x = XIQ(token='not-a-jwt', base_url=server.url, location_cache=LocationCache(str(tmp_path / 'locations.json')))
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            floor_lists = list(executor.map(lambda _: x.getFloors('Building 1'), range(4)))
+        assert all(len(floors) == 5 for floors in floor_lists)
+        assert server.stats['GET /account/home'] == 1
+    finally:
+        x.close()
+
+
+def test_listed_buildings_are_not_looked_up_by_name_again(server, tmp_path):
+    x = XIQ(token=fakeToken(1), base_url=server.url, location_cache=LocationCache(str(tmp_path / 'locations.json')))
+    try:
+        building = x.listBuildings()[0]
+        assert len(x.getBuildingFloors(building)) == 5
+        assert server.stats['GET /locations/building'] == 1
+        assert server.stats['GET /locations/tree'] == 1
+        # cached floors of another building with the same name are not used
+        other = dict(building, id=building['id'] + 1)
+        x.getBuildingFloors(other)
+        assert server.stats['GET /locations/tree'] == 2
+        x.getBuildingFloors(other)
+        assert server.stats['GET /locations/tree'] == 2
+    finally:
+        x.close()
+
+
+def test_interrupted_call_is_cancelled_on_the_event_loop(server):
+    x = XIQ(token=fakeToken(1), base_url=server.url, lro_first_poll=5)
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+    previous = signal.signal(signal.SIGALRM, interrupt)
+    signal.setitimer(signal.ITIMER_REAL, 0.3)
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            for _ in x.sendCLIBatches([device['id'] for device in server.devices], ['show system power status']):
+                pass
+
+        async def runningTasks():
+            await asyncio.sleep(0.1)
+            return len(asyncio.all_tasks()) - 1
+        # the batch wait and the LRO polling were cancelled rather than left running
+        assert asyncio.run_coroutine_threadsafe(runningTasks(), x._XIQ__loop).result() == 0
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        x.close()